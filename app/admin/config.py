@@ -23,66 +23,74 @@ class ImportProductsView(BaseView):
 
 import uuid
 
+def webhook_product(product: Book) -> dict:
+    """Một sách trong payload webhook"""
+    return {
+        "book_id": str(product.id),
+        "title": product.title,
+        "authors": product.authors,
+        "price_vnd": float(product.price_vnd) if product.price_vnd else 0,
+        "stock": int(product.stock) if product.stock else 0,
+        "is_active": product.is_active,
+        "image_url": product.image_url,
+        "description": product.description
+    }
+
+async def deliver_webhook(action: str, products: list):
+    """Gửi webhook tới Chatbot API, ném lỗi nếu thất bại (để hàng đợi job thử lại)"""
+    # Determine event type
+    event_type = "product.upsert" if action in ["create", "update"] else "product.delete"
+    
+    # 1. Prepare payload
+    payload = {
+        "action": action, # Keep backward compatibility
+        "products": products
+    }
+    # Use ensure_ascii=False to support Vietnamese characters in JSON, matching common payload standards
+    json_payload = json.dumps(payload, ensure_ascii=False)
+    
+    # Generate Event ID
+    event_id = str(uuid.uuid4())
+
+    # Debug Secret (Masked)
+    masked_secret = f"{WEBHOOK_SECRET[:5]}...{WEBHOOK_SECRET[-5:]}" if WEBHOOK_SECRET else "None"
+    print(f"--- DEBUG: Using Secret: {masked_secret}")
+
+    # 2. Calculate Signature
+    signature = hmac.new(
+        WEBHOOK_SECRET.encode(),
+        json_payload.encode(), # Encode to UTF-8 bytes
+        hashlib.sha256
+    ).hexdigest()
+
+    # Debug Logs
+    print(f"\n--- WEBHOOK OUTBOUND ---")
+    print(f"URL: {WEBHOOK_URL}")
+    print(f"EVENT_ID: {event_id} | TYPE: {event_type}")
+    print(f"PAYLOAD (Raw): {json_payload}") # Print raw string to verify encoding
+
+    
+    # 3. Send Request
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            WEBHOOK_URL,
+            content=json_payload,
+            headers={
+                "Content-Type": "application/json",
+                "X-Signature": signature,
+                "X-Event-Id": event_id,
+                "X-Event-Type": event_type
+            },
+            timeout=10.0
+        )
+        print(f"--- RESPONSE: {response.status_code} {response.text}")
+        print(f"------------------------\n")
+        response.raise_for_status()
+
 async def send_webhook(action: str, product: Book):
     """Send webhook to Chatbot API"""
     try:
-        # Determine event type
-        event_type = "product.upsert" if action in ["create", "update"] else "product.delete"
-        
-        # 1. Prepare payload
-        payload = {
-            "action": action, # Keep backward compatibility
-            "products": [{
-                "book_id": str(product.id),
-                "title": product.title,
-                "authors": product.authors,
-                "price_vnd": float(product.price_vnd) if product.price_vnd else 0,
-                "stock": int(product.stock) if product.stock else 0,
-                "is_active": product.is_active,
-                "image_url": product.image_url,
-                "description": product.description
-            }]
-        }
-        # Use ensure_ascii=False to support Vietnamese characters in JSON, matching common payload standards
-        json_payload = json.dumps(payload, ensure_ascii=False)
-        
-        # Generate Event ID
-        event_id = str(uuid.uuid4())
-
-        # Debug Secret (Masked)
-        masked_secret = f"{WEBHOOK_SECRET[:5]}...{WEBHOOK_SECRET[-5:]}" if WEBHOOK_SECRET else "None"
-        print(f"--- DEBUG: Using Secret: {masked_secret}")
-
-        # 2. Calculate Signature
-        signature = hmac.new(
-            WEBHOOK_SECRET.encode(),
-            json_payload.encode(), # Encode to UTF-8 bytes
-            hashlib.sha256
-        ).hexdigest()
-
-        # Debug Logs
-        print(f"\n--- WEBHOOK OUTBOUND ---")
-        print(f"URL: {WEBHOOK_URL}")
-        print(f"EVENT_ID: {event_id} | TYPE: {event_type}")
-        print(f"PAYLOAD (Raw): {json_payload}") # Print raw string to verify encoding
-
-        
-        # 3. Send Request
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                WEBHOOK_URL,
-                content=json_payload,
-                headers={
-                    "Content-Type": "application/json",
-                    "X-Signature": signature,
-                    "X-Event-Id": event_id,
-                    "X-Event-Type": event_type
-                },
-                timeout=10.0
-            )
-            print(f"--- RESPONSE: {response.status_code} {response.text}")
-            print(f"------------------------\n")
-
+        await deliver_webhook(action, [webhook_product(product)])
     except Exception as e:
         print(f"!!! Webhook Error: {e}")
 
@@ -134,7 +142,11 @@ def setup_admin(admin):
         icon = "fa-solid fa-shopping-bag"
     
     class OrderItemAdmin(ModelView, model=OrderItem):
-        column_list = [OrderItem.id, OrderItem.order_id, OrderItem.book_id, OrderItem.quantity, OrderItem.price_vnd]
+        column_list = [
+            OrderItem.id, OrderItem.order_id, OrderItem.book_id, OrderItem.book_title,
+            OrderItem.quantity, OrderItem.price_vnd
+        ]
+        column_searchable_list = [OrderItem.book_title]
         name = "Chi tiết đơn hàng"
         name_plural = "Chi tiết đơn hàng"
         icon = "fa-solid fa-list"
@@ -0,0 +1,65 @@
+"""
+Cache trong bộ nhớ cho dữ liệu suy ra từ catalog.
+
+CatalogCache là LRU có TTL, thread-safe, và tự xóa sạch mỗi khi catalog
+(Book/Category) thay đổi nên không bao giờ trả về dữ liệu cũ sau khi commit.
+Cache có chứa tồn kho (`stock=True`) còn bị xóa khi checkout trừ kho.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from app.catalog_events import subscribe, subscribe_stock
+
+MISSING = object()
+
+
+class CatalogCache:
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 300.0, stock: bool = False):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        subscribe(self._on_catalog_change)
+        if stock:
+            subscribe_stock(self._on_stock_change)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def discard_if(self, predicate: Callable[[Hashable], bool]):
+        """Xóa các key thỏa `predicate`"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+    def _on_catalog_change(self, book_ids, category_ids):
+        self.clear()
+
+    def _on_stock_change(self, book_ids):
+        self.clear()
@@ -0,0 +1,150 @@
+"""
+Dọn giỏ hàng bỏ quên.
+
+Mỗi khách vãng lai có một session_id và một dòng carts riêng, giỏ không được
+checkout sẽ nằm lại mãi. Luồng nền xóa các giỏ không thay đổi quá
+CART_TTL_DAYS ngày (theo carts.updated_at, có index), mỗi lô tối đa
+CART_PURGE_BATCH giỏ trong một transaction ngắn để không giữ khóa ghi lâu,
+rồi chạy `PRAGMA incremental_vacuum` để trả lại dung lượng trống (chỉ khi
+database đã ở chế độ auto_vacuum=INCREMENTAL, chuyển một lần bằng
+`python scripts/migrate_incremental_vacuum.py` lúc bảo trì).
+
+Chạy một lần bằng tay:
+
+    python -m app.cart_cleanup
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.cart_store import cart_backend
+from app.database import Cart, CartItem, SessionLocal, engine
+
+CART_TTL_DAYS = float(os.getenv("CART_TTL_DAYS", "30"))
+CART_PURGE_BATCH = int(os.getenv("CART_PURGE_BATCH", "500"))
+# Khoảng cách giữa hai lần dọn (giây), 0 = tắt luồng nền
+CART_PURGE_INTERVAL = float(os.getenv("CART_PURGE_INTERVAL", "3600"))
+
+# PRAGMA auto_vacuum: 0 = NONE, 1 = FULL, 2 = INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class PurgeReport:
+    __slots__ = ("carts", "items", "batches", "pages_reclaimed")
+
+    def __init__(self):
+        self.carts = 0
+        self.items = 0
+        self.batches = 0
+        self.pages_reclaimed = 0
+
+    def __str__(self):
+        return (f"{self.carts} giỏ hàng, {self.items} item trong {self.batches} lô, "
+                f"thu hồi {self.pages_reclaimed} trang")
+
+
+def purge_abandoned_carts(ttl_days: float = CART_TTL_DAYS, batch_size: int = CART_PURGE_BATCH,
+                          now: Optional[datetime] = None) -> PurgeReport:
+    """Xóa giỏ hàng không thay đổi quá `ttl_days` ngày, theo từng lô"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=ttl_days)
+    report = PurgeReport()
+
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.query(Cart.id, Cart.session_id).filter(
+                Cart.updated_at < cutoff
+            ).order_by(Cart.updated_at).limit(batch_size).all()
+            if not rows:
+                break
+
+            # Không chạy song song với flush của CART_BACKEND=memory, và bỏ qua giỏ
+            # có thay đổi chưa ghi (updated_at trong DB cũ nhưng giỏ vẫn đang được dùng)
+            with cart_backend.purge_lock():
+                in_use = cart_backend.dirty_sessions({row.session_id for row in rows})
+                cart_ids = [row.id for row in rows if row.session_id not in in_use]
+                if cart_ids:
+                    report.items += db.query(CartItem).filter(
+                        CartItem.cart_id.in_(cart_ids)
+                    ).delete(synchronize_session=False)
+                    report.carts += db.query(Cart).filter(
+                        Cart.id.in_(cart_ids)
+                    ).delete(synchronize_session=False)
+                    db.commit()
+                    report.batches += 1
+
+                    for row in rows:
+                        if row.session_id not in in_use:
+                            cart_backend.forget(row.session_id)
+
+            if len(rows) < batch_size:
+                break
+    finally:
+        db.close()
+
+    if report.carts:
+        report.pages_reclaimed = incremental_vacuum()
+    return report
+
+
+def incremental_vacuum() -> int:
+    """Trả các trang trống về hệ điều hành, trả về số trang đã thu hồi"""
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        mode = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode != AUTO_VACUUM_INCREMENTAL:
+            # Đổi chế độ cần VACUUM toàn bộ (khóa cả database) -> không làm trong process web
+            print("--- Bỏ qua incremental_vacuum: database chưa ở auto_vacuum=INCREMENTAL "
+                  "(chạy scripts/migrate_incremental_vacuum.py khi bảo trì)")
+            return 0
+
+        before = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        # execute() của sqlite3 chỉ chạy một bước (một trang), executescript chạy hết
+        conn.driver_connection.executescript("PRAGMA incremental_vacuum;")
+        after = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after
+    finally:
+        conn.close()
+
+
+class CartPurger:
+    """Luồng nền chạy purge_abandoned_carts định kỳ"""
+
+    def __init__(self, interval: float = CART_PURGE_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run_once(self) -> PurgeReport:
+        report = purge_abandoned_carts()
+        if report.carts:
+            print(f"--- Dọn giỏ hàng bỏ quên: {report}")
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"!!! Cart purge error: {e}")
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cart-purge", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+cart_purger = CartPurger()
+
+
+if __name__ == "__main__":
+    print(f"✅ Đã dọn {purge_abandoned_carts()}")
@@ -0,0 +1,445 @@
+"""
+Backend lưu giỏ hàng.
+
+- SQLCartBackend (mặc định): đọc/ghi thẳng bảng carts/cart_items như trước.
+- MemoryCartBackend (CART_BACKEND=memory): giỏ hàng nằm trong bộ nhớ, chia
+  shard theo session_id (mỗi shard một lock), nên các khách khác nhau không
+  phải xếp hàng chờ khóa ghi của SQLite. Thay đổi được ghi xuống DB theo lô
+  mỗi CART_FLUSH_INTERVAL giây (write-behind) và được flush đồng bộ trước khi
+  checkout đọc giỏ hàng từ DB.
+
+Với backend bộ nhớ, id của item trong giỏ chính là book_id (mỗi sách chỉ có
+một dòng trong giỏ), nên id không đổi khi dữ liệu được ghi xuống DB.
+
+Router chỉ làm việc với "số lượng theo sách": đọc (lines/read/summary), ghi
+số lượng cuối cùng của các sách bị tác động (apply) và bỏ giỏ sau checkout
+(discard). apply nhận kèm `lines` router đã đọc và chỉ ghi nếu các sách bị
+tác động vẫn có đúng số lượng đó (dưới shard lock với backend bộ nhớ, bằng
+UPDATE/DELETE/INSERT có điều kiện với SQL); nếu không thì ném CartConflict để
+router đọc lại giỏ và tính lại, không làm mất thay đổi của request song song.
+"""
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import exists, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app.database import Book, Cart, CartItem, SessionLocal
+
+CART_BACKEND = os.getenv("CART_BACKEND", "sql")
+CART_SHARDS = int(os.getenv("CART_SHARDS", "16"))
+CART_FLUSH_INTERVAL = float(os.getenv("CART_FLUSH_INTERVAL", "2"))
+# Số giỏ hàng tối đa giữ trong bộ nhớ (chỉ giỏ đã ghi xuống DB mới bị bỏ ra)
+CART_STORE_MAX_SESSIONS = int(os.getenv("CART_STORE_MAX_SESSIONS", "50000"))
+
+# (item_id, book_id, quantity)
+CartLine = Tuple[int, int, int]
+
+
+class CartConflict(Exception):
+    """Giỏ hàng đã bị request khác thay đổi kể từ lúc đọc `lines`"""
+
+
+def current_cart_id(session_id: str):
+    """Subquery id giỏ hàng của session (giỏ tạo sớm nhất nếu có nhiều)"""
+    return select(func.min(Cart.id)).where(Cart.session_id == session_id).scalar_subquery()
+
+
+def load_lines(session_id: str, db: Session) -> Tuple[Optional[int], List[CartLine]]:
+    """(cart_id, các dòng item) của giỏ hàng trong DB"""
+    rows = db.query(Cart.id, CartItem.id, CartItem.book_id, CartItem.quantity).select_from(Cart).outerjoin(
+        CartItem, CartItem.cart_id == Cart.id
+    ).filter(Cart.id == current_cart_id(session_id)).order_by(CartItem.id).all()
+    if not rows:
+        return None, []
+    return rows[0][0], [(item_id, book_id, quantity) for _, item_id, book_id, quantity in rows
+                        if item_id is not None and book_id is not None]
+
+
+def _book_rows(db: Session, book_ids):
+    if not book_ids:
+        return {}
+    rows = db.query(Book.id, Book.title, Book.price_vnd, Book.image_url).filter(Book.id.in_(book_ids)).all()
+    return {row.id: row for row in rows}
+
+
+class SQLCartBackend:
+    """Giỏ hàng đọc/ghi trực tiếp trong SQLite"""
+
+    name = "sql"
+
+    def lines(self, session_id: str, db: Session) -> Tuple[Optional[int], List[CartLine]]:
+        return load_lines(session_id, db)
+
+    def read(self, session_id: str, db: Session):
+        """(cart_id, dòng item kèm thông tin sách) trong một câu JOIN"""
+        rows = db.query(
+            Cart.id.label("cart_id"),
+            CartItem.id,
+            CartItem.book_id,
+            CartItem.quantity,
+            Book.title,
+            Book.price_vnd,
+            Book.image_url,
+        ).select_from(Cart).outerjoin(
+            CartItem, CartItem.cart_id == Cart.id
+        ).outerjoin(
+            Book, CartItem.book_id == Book.id
+        ).filter(Cart.id == current_cart_id(session_id)).order_by(CartItem.id).all()
+        if not rows:
+            return None, []
+        # Giỏ rỗng, hoặc sách đã bị xóa (book_id = NULL)
+        return rows[0].cart_id, [row for row in rows if row.id is not None and row.title is not None]
+
+    def summary(self, session_id: str, db: Session) -> Tuple[int, int, float]:
+        count, items, total = db.query(
+            func.coalesce(func.sum(CartItem.quantity), 0),
+            func.count(CartItem.id),
+            func.coalesce(func.sum(CartItem.quantity * Book.price_vnd), 0.0),
+        ).join(Book, CartItem.book_id == Book.id).filter(
+            CartItem.cart_id == current_cart_id(session_id)
+        ).one()
+        return count, items, float(total)
+
+    def apply(self, session_id: str, quantities: Dict[int, int], db: Session,
+              cart_id: Optional[int] = None, lines: Optional[List[CartLine]] = None) -> int:
+        """Ghi số lượng cuối cùng của các sách (0 = xóa) trong một transaction"""
+        if lines is None:
+            cart_id, lines = self.lines(session_id, db)
+        items_by_book = {book_id: (item_id, quantity) for item_id, book_id, quantity in lines}
+
+        now = datetime.utcnow()
+        if cart_id is None:
+            # Chỉ tạo giỏ nếu session vẫn chưa có giỏ (hai request đầu tiên chạy song song)
+            cart_id = db.execute(insert(Cart).from_select(
+                ["session_id", "created_at", "updated_at"],
+                select(literal(session_id), literal(now), literal(now)).where(
+                    ~exists().where(Cart.session_id == session_id)
+                ),
+            ).returning(Cart.id)).scalar()
+            if cart_id is None:
+                db.rollback()
+                raise CartConflict(session_id)
+
+        for book_id, quantity in quantities.items():
+            current = items_by_book.get(book_id)
+            # Mỗi câu chỉ có hiệu lực nếu dòng vẫn như lúc đọc, rowcount = 0 -> đã bị đổi
+            if current is None:
+                if quantity <= 0:
+                    continue
+                changed = db.execute(insert(CartItem).from_select(
+                    ["cart_id", "book_id", "quantity", "created_at"],
+                    select(literal(cart_id), literal(book_id), literal(quantity), literal(now)).where(
+                        ~exists().where(CartItem.cart_id == cart_id, CartItem.book_id == book_id)
+                    ),
+                )).rowcount
+            elif quantity <= 0:
+                changed = db.query(CartItem).filter(
+                    CartItem.id == current[0], CartItem.quantity == current[1]
+                ).delete(synchronize_session=False)
+            else:
+                changed = db.query(CartItem).filter(
+                    CartItem.id == current[0], CartItem.quantity == current[1]
+                ).update({CartItem.quantity: quantity}, synchronize_session=False)
+            if not changed:
+                db.rollback()
+                raise CartConflict(session_id)
+
+        # Giỏ vừa bị dọn (app/cart_cleanup.py) giữa lúc đọc và lúc ghi -> đọc lại, tạo giỏ mới
+        if not db.query(Cart).filter(Cart.id == cart_id).update({Cart.updated_at: now}, synchronize_session=False):
+            db.rollback()
+            raise CartConflict(session_id)
+        db.commit()
+        return cart_id
+
+    def discard(self, session_id: str):
+        pass
+
+    @contextmanager
+    def purge_lock(self):
+        yield
+
+    def dirty_sessions(self, session_ids) -> set:
+        return set()
+
+    def forget(self, session_id: str):
+        pass
+
+    def flush(self, session_id: Optional[str] = None):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class _Entry:
+    __slots__ = ("cart_id", "items", "dirty", "version")
+
+    def __init__(self, cart_id: Optional[int], items: Dict[int, int]):
+        self.cart_id = cart_id
+        self.items = items  # book_id -> quantity, theo thứ tự thêm vào
+        self.dirty = False
+        self.version = 0
+
+
+class _Shard:
+    __slots__ = ("lock", "entries")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+
+class MemoryCartBackend:
+    """Giỏ hàng trong bộ nhớ, chia shard, ghi xuống DB theo lô (write-behind)"""
+
+    name = "memory"
+
+    def __init__(self, shards: int = CART_SHARDS, flush_interval: float = CART_FLUSH_INTERVAL,
+                 max_sessions: int = CART_STORE_MAX_SESSIONS):
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self.flush_interval = flush_interval
+        self.max_per_shard = max(1, max_sessions // len(self._shards))
+        # Chỉ một lần ghi xuống DB tại một thời điểm (SQLite chỉ có một writer)
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _shard(self, session_id: str) -> _Shard:
+        return self._shards[zlib.crc32(session_id.encode("utf-8")) % len(self._shards)]
+
+    def _load(self, session_id: str, shard: _Shard):
+        """Nạp giỏ của session từ DB nếu shard chưa có (truy vấn nằm ngoài shard.lock)"""
+        with shard.lock:
+            if session_id in shard.entries:
+                return
+
+        db = SessionLocal()
+        try:
+            cart_id, lines = load_lines(session_id, db)
+        finally:
+            db.close()
+
+        with shard.lock:
+            # Request khác đã nạp (và có thể đã sửa) giỏ trong lúc đọc DB -> giữ bản đó
+            if session_id in shard.entries:
+                return
+            shard.entries[session_id] = _Entry(cart_id, {book_id: quantity for _, book_id, quantity in lines})
+
+            # Bỏ bớt các giỏ đã ghi xuống DB, dùng lâu nhất
+            if len(shard.entries) > self.max_per_shard:
+                for key in list(shard.entries):
+                    if len(shard.entries) <= self.max_per_shard:
+                        break
+                    if key != session_id and not shard.entries[key].dirty:
+                        del shard.entries[key]
+
+    @contextmanager
+    def _locked_entry(self, session_id: str):
+        """Entry của session, dùng trong khối with khi đang giữ shard.lock"""
+        shard = self._shard(session_id)
+        while True:
+            self._load(session_id, shard)
+            with shard.lock:
+                entry = shard.entries.get(session_id)
+                if entry is None:
+                    continue  # vừa bị bỏ ra (discard/eviction) giữa hai lần lấy lock -> nạp lại
+                shard.entries.move_to_end(session_id)
+                yield entry
+                return
+
+    def _snapshot(self, session_id: str) -> Tuple[Optional[int], Dict[int, int]]:
+        with self._locked_entry(session_id) as entry:
+            return entry.cart_id, dict(entry.items)
+
+    def lines(self, session_id: str, db: Session) -> Tuple[Optional[int], List[CartLine]]:
+        cart_id, items = self._snapshot(session_id)
+        if cart_id is None and items:
+            cart_id = 0  # giỏ mới, chưa ghi xuống DB
+        return cart_id, [(book_id, book_id, quantity) for book_id, quantity in items.items()]
+
+    def read(self, session_id: str, db: Session):
+        cart_id, items = self._snapshot(session_id)
+        if cart_id is None and not items:
+            return None, []
+        books = _book_rows(db, list(items))
+        rows = []
+        for book_id, quantity in items.items():
+            book = books.get(book_id)
+            if book is None:
+                continue
+            rows.append(_MemoryRow(book_id, book_id, quantity, book.title, book.price_vnd, book.image_url))
+        # Giỏ chưa ghi xuống DB chưa có id -> dùng 0 như giỏ trống
+        return cart_id or 0, rows
+
+    def summary(self, session_id: str, db: Session) -> Tuple[int, int, float]:
+        _, rows = self.read(session_id, db)
+        return (sum(row.quantity for row in rows), len(rows),
+                float(sum(row.quantity * row.price_vnd for row in rows)))
+
+    def apply(self, session_id: str, quantities: Dict[int, int], db: Session,
+              cart_id: Optional[int] = None, lines: Optional[List[CartLine]] = None) -> int:
+        expected = {book_id: quantity for _, book_id, quantity in lines} if lines is not None else None
+        with self._locked_entry(session_id) as entry:
+            # So sánh rồi ghi dưới cùng một lock: sách bị request khác đổi -> router tính lại
+            if expected is not None and any(entry.items.get(book_id) != expected.get(book_id)
+                                            for book_id in quantities):
+                raise CartConflict(session_id)
+            for book_id, quantity in quantities.items():
+                if quantity <= 0:
+                    entry.items.pop(book_id, None)
+                else:
+                    entry.items[book_id] = quantity
+            entry.dirty = True
+            entry.version += 1
+            return entry.cart_id or 0
+
+    def discard(self, session_id: str):
+        """Bỏ giỏ khỏi bộ nhớ (sau checkout giỏ trong DB đã bị xóa)"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            shard.entries.pop(session_id, None)
+
+    @contextmanager
+    def purge_lock(self):
+        """Dọn giỏ bỏ quên không chạy song song với flush (flush không ghi item cho giỏ vừa bị xóa)"""
+        with self._flush_lock:
+            yield
+
+    def dirty_sessions(self, session_ids) -> set:
+        """Các session có thay đổi chưa ghi xuống DB (giỏ vẫn đang được dùng, không dọn)"""
+        dirty = set()
+        for session_id in session_ids:
+            shard = self._shard(session_id)
+            with shard.lock:
+                entry = shard.entries.get(session_id)
+                if entry is not None and entry.dirty:
+                    dirty.add(session_id)
+        return dirty
+
+    def forget(self, session_id: str):
+        """Giỏ trong DB vừa bị dọn: bỏ entry, hoặc nếu vừa có thay đổi thì tạo giỏ mới ở lần flush sau"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            entry = shard.entries.get(session_id)
+            if entry is None:
+                return
+            if entry.dirty:
+                entry.cart_id = None
+            else:
+                del shard.entries[session_id]
+
+    def flush(self, session_id: Optional[str] = None) -> int:
+        """Ghi các giỏ đã thay đổi xuống DB trong một transaction, trả về số giỏ đã ghi"""
+        with self._flush_lock:
+            # Chụp trạng thái dưới lock của từng shard
+            pending = []
+            shards = [self._shard(session_id)] if session_id else self._shards
+            for shard in shards:
+                with shard.lock:
+                    for key, entry in shard.entries.items():
+                        if entry.dirty and (session_id is None or key == session_id):
+                            pending.append((key, entry, entry.version, entry.cart_id, dict(entry.items)))
+            if not pending:
+                return 0
+
+            db = SessionLocal()
+            try:
+                cart_ids = self._persist(db, pending)
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+
+            # Chỉ đánh dấu sạch nếu không có thay đổi mới trong lúc ghi
+            for (key, entry, version, _, _), new_cart_id in zip(pending, cart_ids):
+                shard = self._shard(key)
+                with shard.lock:
+                    entry.cart_id = new_cart_id
+                    if entry.version == version:
+                        entry.dirty = False
+            return len(pending)
+
+    @staticmethod
+    def _persist(db: Session, pending) -> List[Optional[int]]:
+        now = datetime.utcnow()
+        cart_ids: List[Optional[int]] = []
+        new_carts = {}
+        for key, _, _, cart_id, items in pending:
+            if cart_id is None and items:
+                cart = Cart(session_id=key, updated_at=now)
+                db.add(cart)
+                new_carts[key] = cart
+        if new_carts:
+            db.flush()
+
+        existing = [cart_id for _, _, _, cart_id, _ in pending if cart_id is not None]
+        if existing:
+            db.query(CartItem).filter(CartItem.cart_id.in_(existing)).delete(synchronize_session=False)
+            db.query(Cart).filter(Cart.id.in_(existing)).update({Cart.updated_at: now}, synchronize_session=False)
+
+        rows = []
+        for key, _, _, cart_id, items in pending:
+            if cart_id is None and key in new_carts:
+                cart_id = new_carts[key].id
+            cart_ids.append(cart_id)
+            rows.extend({"cart_id": cart_id, "book_id": book_id, "quantity": quantity, "created_at": now}
+                        for book_id, quantity in items.items())
+        if rows:
+            db.execute(CartItem.__table__.insert(), rows)
+        db.commit()
+        return cart_ids
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"!!! Cart flush error: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="cart-flush", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Dừng luồng nền và ghi nốt các thay đổi còn lại"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+class _MemoryRow:
+    """Dòng item cùng dạng với kết quả JOIN của SQLCartBackend.read"""
+    __slots__ = ("id", "book_id", "quantity", "title", "price_vnd", "image_url")
+
+    def __init__(self, id, book_id, quantity, title, price_vnd, image_url):
+        self.id = id
+        self.book_id = book_id
+        self.quantity = quantity
+        self.title = title
+        self.price_vnd = price_vnd
+        self.image_url = image_url
+
+
+def create_backend(name: str = CART_BACKEND):
+    if name == "memory":
+        return MemoryCartBackend()
+    if name == "sql":
+        return SQLCartBackend()
+    raise ValueError(f"CART_BACKEND không hợp lệ: {name}")
+
+
+cart_backend = create_backend()
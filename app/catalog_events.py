@@ -0,0 +1,103 @@
+"""
+Sự kiện thay đổi catalog (Book, Category).
+
+Gom id các Book/Category bị thêm/sửa/xóa trong mỗi lần flush và chỉ phát cho
+các subscriber sau khi transaction commit thành công, để các cấu trúc trong bộ
+nhớ (chỉ mục gợi ý, cache...) không bao giờ thấy dữ liệu đã bị rollback.
+
+Checkout chỉ trừ tồn kho, thay đổi thường xuyên nhất: nó phát `notify_stock`
+thay vì `notify`, nên các cache không chứa tồn kho (đếm kết quả, facet, chỉ mục
+gợi ý) và phiên bản catalog được giữ nguyên; chỉ dữ liệu theo từng sách và các
+cache có chứa tồn kho (đăng ký bằng `subscribe_stock`) được làm mới.
+"""
+from itertools import chain
+from typing import Callable, Dict, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.database import Book, Category
+
+_SESSION_KEY = "catalog_changes"
+
+# callback(book_ids, category_ids)
+_subscribers: List[Callable[[Set[int], Set[int]], None]] = []
+
+# callback(book_ids), chỉ tồn kho thay đổi
+_stock_subscribers: List[Callable[[Set[int]], None]] = []
+
+# Tăng mỗi lần catalog thay đổi (dùng cho ETag)
+_version = 0
+# Tăng mỗi lần tồn kho thay đổi: toàn bộ và theo từng sách
+_stock_version = 0
+_book_stock_versions: Dict[int, int] = {}
+
+
+def catalog_version() -> int:
+    return _version
+
+
+def stock_version(book_id: Optional[int] = None) -> int:
+    """Phiên bản tồn kho của cả catalog, hoặc của một sách"""
+    if book_id is None:
+        return _stock_version
+    return _book_stock_versions.get(book_id, 0)
+
+
+def subscribe(callback: Callable[[Set[int], Set[int]], None]):
+    """Đăng ký callback chạy sau mỗi commit có thay đổi catalog"""
+    _subscribers.append(callback)
+    return callback
+
+
+def subscribe_stock(callback: Callable[[Set[int]], None]):
+    """Đăng ký callback chạy khi chỉ tồn kho của các sách thay đổi"""
+    _stock_subscribers.append(callback)
+    return callback
+
+
+def notify(book_ids: Set[int] = frozenset(), category_ids: Set[int] = frozenset()):
+    """Phát sự kiện thủ công (vd. sau khi ghi bằng SQL thuần)"""
+    global _version
+    for callback in list(_subscribers):
+        try:
+            callback(set(book_ids), set(category_ids))
+        except Exception as e:
+            print(f"!!! Catalog subscriber error ({getattr(callback, '__name__', callback)}): {e}")
+    # Tăng sau khi các cache đã được làm mới để ETag mới không đi kèm dữ liệu cũ
+    _version += 1
+
+
+def notify_stock(book_ids: Set[int]):
+    """Phát sự kiện chỉ tồn kho thay đổi (vd. checkout trừ kho bằng SQL thuần)"""
+    global _stock_version
+    for callback in list(_stock_subscribers):
+        try:
+            callback(set(book_ids))
+        except Exception as e:
+            print(f"!!! Stock subscriber error ({getattr(callback, '__name__', callback)}): {e}")
+    for book_id in book_ids:
+        _book_stock_versions[book_id] = _book_stock_versions.get(book_id, 0) + 1
+    _stock_version += 1
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    book_ids, category_ids = session.info.setdefault(_SESSION_KEY, (set(), set()))
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Book) and obj.id is not None:
+            book_ids.add(obj.id)
+        elif isinstance(obj, Category) and obj.id is not None:
+            category_ids.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    changes = session.info.pop(_SESSION_KEY, None)
+    if changes and (changes[0] or changes[1]):
+        notify(*changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,197 @@
+"""
+Read model của catalog trong bộ nhớ cho các GET /api/products.
+
+Bật bằng biến môi trường CATALOG_SNAPSHOT=1. Khi bật, toàn bộ sách đang bán
+được nạp một lần lúc khởi động thành các BookRecord gọn (__slots__), kèm thứ
+tự sắp xếp dựng sẵn theo từng (danh mục, sort_by); get_products/get_product
+trả dữ liệu mà không chạy câu SQL nào. Mỗi lần BookAdmin, import Excel hoặc
+checkout commit, chỉ các sách/danh mục bị đổi được nạp lại và thay tại chỗ:
+đổi tồn kho/nội dung chỉ thay record trong các thứ tự sẵn có, đổi khóa sắp
+xếp (ngày tạo, giá, rating, danh mục, ẩn/hiện) chỉ chuyển vị trí một record
+bằng bisect, không sắp xếp lại cả catalog.
+"""
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.catalog_events import subscribe, subscribe_stock
+from app.database import Book, Category, SessionLocal
+from app.pagination import SORT_COLUMNS, decode_cursor, encode_cursor
+
+RESPONSE_FIELDS = (
+    "id", "title", "authors", "description", "price_vnd", "stock", "image_url",
+    "rating_avg", "pages", "publisher", "publish_year", "category_id", "category_name",
+)
+
+
+class BookRecord:
+    __slots__ = RESPONSE_FIELDS + ("created_at",)
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in RESPONSE_FIELDS}
+
+
+def _sort_key(sort_by: str, value, book_id: int) -> tuple:
+    """Khóa so sánh tăng dần tương ứng với thứ tự hiển thị của sort_by"""
+    column, descending = SORT_COLUMNS[sort_by]
+    if column is None:
+        key = (book_id,)
+    else:
+        if isinstance(value, datetime):
+            value = value.timestamp()
+        key = (value or 0, book_id)
+    return tuple(-part for part in key) if descending else key
+
+
+def _record_key(sort_by: str, record: BookRecord) -> tuple:
+    column, _ = SORT_COLUMNS[sort_by]
+    return _sort_key(sort_by, getattr(record, column.key) if column is not None else None, record.id)
+
+
+# Đổi một trong các trường này -> record phải đổi vị trí trong các thứ tự sắp xếp
+ORDERING_FIELDS = ("created_at", "price_vnd", "rating_avg", "category_id")
+
+
+class CatalogSnapshot:
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._records: Dict[int, BookRecord] = {}
+        # (sort_by, category_id|None) -> (records theo thứ tự, khóa tăng dần song song)
+        self._orderings: Dict[Tuple[str, Optional[int]], Tuple[List[BookRecord], List[tuple]]] = {}
+
+    @staticmethod
+    def _query_records(db, book_ids=None) -> List[BookRecord]:
+        query = db.query(
+            *[getattr(Book, name) for name in RESPONSE_FIELDS if name != "category_name"],
+            Book.created_at,
+            Category.name.label("category_name"),
+        ).outerjoin(Category, Book.category_id == Category.id).filter(Book.is_active == True)
+        if book_ids is not None:
+            query = query.filter(Book.id.in_(book_ids))
+        return [BookRecord(**row._asdict()) for row in query]
+
+    def load(self):
+        """Nạp toàn bộ catalog và dựng sẵn mọi thứ tự sắp xếp"""
+        db = SessionLocal()
+        try:
+            records = {r.id: r for r in self._query_records(db)}
+        finally:
+            db.close()
+        category_ids = {r.category_id for r in records.values()}
+        with self._lock:
+            self._records = records
+            self._orderings = {}
+            for sort_by in SORT_COLUMNS:
+                self._ordering(sort_by, None)
+                for category_id in category_ids:
+                    self._ordering(sort_by, category_id)
+        print(f"--- Catalog snapshot loaded: {len(records)} books")
+
+    def refresh(self, book_ids: Set[int], category_ids: Set[int] = frozenset()):
+        """Nạp lại các sách/danh mục vừa thay đổi (gọi sau commit)"""
+        if not self.enabled:
+            return
+        db = SessionLocal()
+        try:
+            changed = {r.id: r for r in self._query_records(db, book_ids)} if book_ids else {}
+            names = dict(db.query(Category.id, Category.name).filter(Category.id.in_(category_ids)).all()) if category_ids else {}
+        finally:
+            db.close()
+
+        with self._lock:
+            for book_id in book_ids:
+                old, new = self._records.get(book_id), changed.get(book_id)
+                if old is None and new is None:
+                    continue
+                if old is not None and new is not None and all(
+                    getattr(old, name) == getattr(new, name) for name in ORDERING_FIELDS
+                ):
+                    self._swap(old, new)
+                else:
+                    if old is not None:
+                        self._remove(old)
+                    if new is not None:
+                        self._insert(new)
+                if new is None:
+                    del self._records[book_id]
+                else:
+                    self._records[book_id] = new
+
+            if category_ids:
+                # Đổi tên danh mục (hiếm): khóa sắp xếp không đổi, chỉ thay record
+                for record in list(self._records.values()):
+                    if record.category_id in category_ids:
+                        values = {name: getattr(record, name) for name in BookRecord.__slots__}
+                        values["category_name"] = names.get(record.category_id)
+                        renamed = BookRecord(**values)
+                        self._swap(record, renamed)
+                        self._records[record.id] = renamed
+
+    def _orderings_of(self, record: BookRecord):
+        """Các thứ tự đã dựng có chứa record (toàn catalog + danh mục của nó)"""
+        for (sort_by, category_id), ordering in self._orderings.items():
+            if category_id is None or category_id == record.category_id:
+                yield sort_by, ordering
+
+    def _swap(self, old: BookRecord, new: BookRecord):
+        for sort_by, (records, keys) in self._orderings_of(old):
+            index = bisect_left(keys, _record_key(sort_by, old))
+            if index < len(records) and records[index] is old:
+                records[index] = new
+
+    def _remove(self, record: BookRecord):
+        for sort_by, (records, keys) in self._orderings_of(record):
+            index = bisect_left(keys, _record_key(sort_by, record))
+            if index < len(records) and records[index] is record:
+                del records[index]
+                del keys[index]
+
+    def _insert(self, record: BookRecord):
+        for sort_by, (records, keys) in self._orderings_of(record):
+            key = _record_key(sort_by, record)
+            index = bisect_left(keys, key)
+            keys.insert(index, key)
+            records.insert(index, record)
+
+    def _ordering(self, sort_by: str, category_id: Optional[int]):
+        """Thứ tự (records, keys) của sort_by trong danh mục; gọi khi đang giữ self._lock"""
+        key = (sort_by, category_id)
+        ordering = self._orderings.get(key)
+        if ordering is None:
+            keyed = sorted(
+                (_record_key(sort_by, r), r) for r in self._records.values()
+                if category_id is None or r.category_id == category_id
+            )
+            ordering = ([r for _, r in keyed], [k for k, _ in keyed])
+            self._orderings[key] = ordering
+        return ordering
+
+    def get(self, book_id: int) -> Optional[BookRecord]:
+        return self._records.get(book_id)
+
+    def page(self, category_id: Optional[int], sort_by: str, limit: int, offset: int = 0, cursor: Optional[str] = None):
+        """Một trang sách theo thứ tự sort_by; trả về (records, next_cursor)"""
+        last = decode_cursor(cursor, sort_by) if cursor else None
+        with self._lock:
+            records, keys = self._ordering(sort_by, category_id or None)
+            if last is not None:
+                column, _ = SORT_COLUMNS[sort_by]
+                start = bisect_right(keys, _sort_key(sort_by, last[0] if column is not None else None, last[-1]))
+            else:
+                start = offset
+            page = records[start:start + limit]
+            has_more = page and len(page) == limit and start + limit < len(records)
+        next_page = encode_cursor(page[-1], sort_by) if has_more else None
+        return page, next_page
+
+
+catalog_snapshot = CatalogSnapshot(enabled=os.getenv("CATALOG_SNAPSHOT", "0") == "1")
+subscribe(catalog_snapshot.refresh)
+subscribe_stock(catalog_snapshot.refresh)
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Float, Text, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -14,6 +14,12 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def ensure_indexes():
+    """Tạo các index mới khai báo trên bảng đã tồn tại (create_all bỏ qua bảng cũ)"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 # Models
 class Category(Base):
     __tablename__ = "categories"
@@ -47,6 +53,16 @@ class Book(Base):
     
     category = relationship("Category", back_populates="books")
     order_items = relationship("OrderItem", back_populates="book")
+    
+    # Index cho phân trang keyset theo từng kiểu sắp xếp (SQLite tự thêm rowid = id vào cuối index)
+    __table_args__ = (
+        Index("ix_books_active_created", "is_active", "created_at"),
+        Index("ix_books_active_price", "is_active", "price_vnd"),
+        Index("ix_books_active_rating", "is_active", "rating_avg"),
+        Index("ix_books_category_created", "category_id", "is_active", "created_at"),
+        Index("ix_books_category_price", "category_id", "is_active", "price_vnd"),
+        Index("ix_books_category_rating", "category_id", "is_active", "rating_avg"),
+    )
 
 class Cart(Base):
     __tablename__ = "carts"
@@ -54,7 +70,8 @@ class Cart(Base):
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(100), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # index: dọn giỏ hàng bỏ quên theo thời gian (app/cart_cleanup.py)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan")
 
@@ -62,7 +79,7 @@ class CartItem(Base):
     __tablename__ = "cart_items"
     
     id = Column(Integer, primary_key=True, index=True)
-    cart_id = Column(Integer, ForeignKey("carts.id"), nullable=False)
+    cart_id = Column(Integer, ForeignKey("carts.id"), nullable=False, index=True)
     book_id = Column(Integer, ForeignKey("books.id", ondelete="SET NULL"), nullable=True)
     quantity = Column(Integer, default=1, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -76,7 +93,8 @@ class Order(Base):
     id = Column(Integer, primary_key=True, index=True)
     order_number = Column(String(50), unique=True, nullable=False, index=True)
     session_id = Column(String(100), nullable=False, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # index: lịch sử đơn hàng theo user (app/routers/orders.py)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     customer_name = Column(String(200), nullable=False)
     customer_phone = Column(String(20), nullable=False)
     customer_address = Column(Text, nullable=False)
@@ -89,14 +107,26 @@ class Order(Base):
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     user = relationship("User", back_populates="orders")
 
+class OrderSequence(Base):
+    """Bộ đếm đơn hàng theo ngày, dùng để sinh order_number (app/routers/checkout.py)"""
+    __tablename__ = "order_sequences"
+    
+    day = Column(String(8), primary_key=True)  # YYYYMMDD
+    last_value = Column(Integer, nullable=False, default=0)
+
 class OrderItem(Base):
     __tablename__ = "order_items"
     
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     book_id = Column(Integer, ForeignKey("books.id", ondelete="SET NULL"), nullable=True)
     quantity = Column(Integer, nullable=False)
     price_vnd = Column(Float, nullable=False)
+    # Ảnh chụp thông tin sách lúc đặt hàng: lịch sử đơn không cần đọc bảng books
+    # và vẫn hiển thị được khi sách đã bị xóa (book_id = NULL)
+    book_title = Column(String(200), nullable=True)
+    book_authors = Column(String(200), nullable=True)
+    book_image_url = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     order = relationship("Order", back_populates="items")
@@ -116,3 +146,33 @@ class User(Base):
     
     orders = relationship("Order", back_populates="user")
 
+
+class Job(Base):
+    """Công việc nền bền vững (app/task_queue.py)"""
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON
+    status = Column(String(20), nullable=False, default="pending")  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        # Worker lấy job: WHERE status = 'pending' AND run_at <= now ORDER BY run_at
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+
+class DailySales(Base):
+    """Doanh số theo ngày và theo sách, được job analytics tổng hợp lại từ đơn hàng"""
+    __tablename__ = "daily_sales"
+    
+    day = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    book_id = Column(Integer, primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
@@ -0,0 +1,92 @@
+"""
+ETag và conditional GET cho các API catalog.
+
+ETag mạnh được suy ra từ phiên bản catalog (tăng sau mỗi commit thay đổi
+Book/Category), phiên bản tồn kho và mã khởi động của process. Chi tiết một
+sách (/api/products/{id}) dùng phiên bản tồn kho của riêng sách đó, nên đơn
+hàng của sách khác không làm mất 304 của nó. Request có If-None-Match khớp
+được trả 304 ngay trong middleware, trước khi mở session hay chạy ORM.
+Phiên bản catalog nằm trong bộ nhớ nên giả định app chạy một process
+(như `python main.py`).
+"""
+import os
+import re
+import uuid
+from typing import Optional
+
+from app.catalog_events import catalog_version, stock_version
+
+# Tiền tố đường dẫn được áp dụng ETag
+CATALOG_PATHS = ("/api/products", "/api/search", "/api/home")
+
+# Trình duyệt luôn hỏi lại (rẻ nhờ 304), edge Cloudflare được giữ bản sao ngắn hạn
+CATALOG_CACHE_CONTROL = os.getenv(
+    "CATALOG_CACHE_CONTROL", "public, max-age=0, s-maxage=60, stale-while-revalidate=30"
+)
+
+BOOT_ID = uuid.uuid4().hex[:8]
+
+PRODUCT_DETAIL_PATH = re.compile(r"^/api/products/(\d+)/?$")
+
+
+def current_etag(path: Optional[str] = None) -> str:
+    """ETag hiện tại của đường dẫn `path` (trang danh sách dùng phiên bản tồn kho toàn bộ)"""
+    match = PRODUCT_DETAIL_PATH.match(path) if path else None
+    stock = stock_version(int(match.group(1))) if match else stock_version()
+    return f'"{BOOT_ID}-{catalog_version()}.{stock}"'
+
+
+def _opaque_tag(tag: str) -> str:
+    """Bỏ tiền tố W/ (Cloudflare đổi ETag mạnh thành yếu khi nén response)"""
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """So sánh yếu theo RFC 7232 cho If-None-Match"""
+    etag = _opaque_tag(etag)
+    return any(_opaque_tag(tag) in (etag, "*") for tag in header.split(","))
+
+
+class CatalogETagMiddleware:
+    """ASGI middleware: ETag/Cache-Control cho GET catalog, 304 khi client đã có bản mới nhất"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("GET", "HEAD")
+            or not scope["path"].startswith(CATALOG_PATHS)
+        ):
+            return await self.app(scope, receive, send)
+
+        # Lấy ETag trước khi xử lý: nếu catalog đổi giữa chừng, client chỉ phải tải lại lần sau
+        etag = current_etag(scope["path"])
+        headers = dict(scope["headers"])
+        if_none_match = headers.get(b"if-none-match")
+        if if_none_match and _etag_matches(if_none_match.decode("latin-1"), etag):
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [
+                    (b"etag", etag.encode()),
+                    (b"cache-control", CATALOG_CACHE_CONTROL.encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_etag(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                response_headers = [
+                    (name, value) for name, value in message.get("headers", []) if name.lower() != b"etag"
+                ]
+                response_headers.append((b"etag", etag.encode()))
+                if not any(name.lower() == b"cache-control" for name, _ in response_headers):
+                    response_headers.append((b"cache-control", CATALOG_CACHE_CONTROL.encode()))
+                message = {**message, "headers": response_headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
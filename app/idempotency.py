@@ -0,0 +1,95 @@
+"""
+Idempotency-Key cho các request ghi (checkout).
+
+Client gửi header `Idempotency-Key` (vd. một UUID cho mỗi lần bấm đặt hàng) và
+dùng lại đúng key đó khi gửi lại request. Request đầu tiên được xử lý bình
+thường và kết quả (bytes JSON đã serialize) được lưu lại; các lần gửi lại
+nhận ngay kết quả đó mà không chạm tới database. Trong lúc request đầu còn
+đang chạy, các lần gửi lại nhận 409 thay vì chờ khóa.
+
+Kết quả lỗi không được lưu: key được nhả ra để client có thể thử lại.
+Store nằm trong bộ nhớ của process (ứng dụng chạy một process uvicorn).
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+MAX_KEY_LENGTH = 255
+
+# Trạng thái trả về từ begin()
+STARTED = "started"          # request mới, hãy xử lý rồi gọi complete()/release()
+REPLAY = "replay"            # đã có kết quả
+IN_PROGRESS = "in_progress"  # request cùng key đang được xử lý
+MISMATCH = "mismatch"        # key đã dùng cho một payload khác
+
+
+def fingerprint(payload: bytes) -> bytes:
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires_at", "body", "status_code")
+
+    def __init__(self, fingerprint: bytes, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.body: Optional[bytes] = None  # None = đang xử lý
+        self.status_code = 200
+
+
+class IdempotencyStore:
+    """key -> kết quả đã serialize, hết hạn sau `ttl` giây"""
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, maxsize: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # Mọi key có cùng TTL -> thứ tự thêm vào cũng là thứ tự hết hạn
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self, now: float):
+        entries = self._entries
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if entry.expires_at > now and len(entries) <= self.maxsize:
+                break
+            del entries[key]
+
+    def begin(self, key: str, request_fingerprint: bytes) -> Tuple[str, Optional[_Entry]]:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = _Entry(request_fingerprint, now + self.ttl)
+                return STARTED, None
+            if entry.fingerprint != request_fingerprint:
+                return MISMATCH, entry
+            if entry.body is None:
+                return IN_PROGRESS, entry
+            return REPLAY, entry
+
+    def complete(self, key: str, body: bytes, status_code: int = 200):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.body = body
+                entry.status_code = status_code
+
+    def release(self, key: str):
+        """Bỏ key của request thất bại để có thể gửi lại"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.body is None:
+                del self._entries[key]
+
+
+checkout_keys = IdempotencyStore()
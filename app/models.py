@@ -1,5 +1,5 @@
 # Re-export models from database for convenience
-from app.database import Book, Category, Order, OrderItem, Cart, CartItem, User, SessionLocal
+from app.database import Book, Category, Order, OrderItem, OrderSequence, Cart, CartItem, User, Job, DailySales, SessionLocal
 
-__all__ = ["Book", "Category", "Order", "OrderItem", "Cart", "CartItem", "User", "SessionLocal"]
+__all__ = ["Book", "Category", "Order", "OrderItem", "OrderSequence", "Cart", "CartItem", "User", "Job", "DailySales", "SessionLocal"]
 
@@ -0,0 +1,76 @@
+"""
+Phân trang keyset (cursor) cho danh sách sách.
+
+Cursor là chuỗi base64url mờ chứa thứ tự sắp xếp và khóa (giá trị sắp xếp, id)
+của dòng cuối trang trước. Trang tiếp theo được lấy bằng điều kiện
+`(sort_key, id) < (:v, :id)` nên SQLite nhảy thẳng tới vị trí trong index thay
+vì đọc rồi bỏ qua `offset` dòng như phân trang truyền thống.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+from app.database import Book
+
+# sort_by -> (cột sắp xếp, chiều giảm dần?); id luôn là khóa phụ cùng chiều
+SORT_COLUMNS = {
+    "default": (None, False),
+    "newest": (Book.created_at, True),
+    "price_asc": (Book.price_vnd, False),
+    "price_desc": (Book.price_vnd, True),
+    "rating": (Book.rating_avg, True),
+}
+
+
+def apply_sort(query, sort_by: str):
+    """Sắp xếp theo sort_by, kèm Book.id để thứ tự luôn xác định"""
+    column, descending = SORT_COLUMNS[sort_by]
+    columns = [Book.id] if column is None else [column, Book.id]
+    return query.order_by(*[c.desc() if descending else c.asc() for c in columns])
+
+
+def _encode_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_cursor(book, sort_by: str) -> str:
+    column, _ = SORT_COLUMNS[sort_by]
+    key = [book.id] if column is None else [_encode_value(getattr(book, column.key)), book.id]
+    raw = json.dumps({"s": sort_by, "k": key}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        key = data["k"]
+        if data["s"] != sort_by:
+            raise ValueError("sort mismatch")
+        column, _ = SORT_COLUMNS[sort_by]
+        if column is not None and column.key == "created_at":
+            key[0] = datetime.fromisoformat(key[0])
+        return key
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+
+
+def apply_cursor(query, sort_by: str, cursor: str):
+    """Lọc các dòng đứng sau cursor theo thứ tự sort_by"""
+    column, descending = SORT_COLUMNS[sort_by]
+    key = decode_cursor(cursor, sort_by)
+    if column is None:
+        return query.filter(Book.id < key[0] if descending else Book.id > key[0])
+    row, value = tuple_(column, Book.id), tuple_(*key)
+    return query.filter(row < value if descending else row > value)
+
+
+def next_cursor(books: List[Book], sort_by: str, limit: int) -> Optional[str]:
+    """Cursor của trang kế tiếp, None nếu đã hết dữ liệu"""
+    if limit <= 0 or len(books) < limit:
+        return None
+    return encode_cursor(books[-1], sort_by)
@@ -0,0 +1,116 @@
+"""
+Đếm số câu SQL chạy trong mỗi request.
+
+QueryCountMiddleware gắn một bộ đếm vào context của request. Khi bật
+QUERY_COUNT_HEADER=1 (dev/test), số câu lệnh được trả qua header X-Query-Count
+nên test có thể kiểm tra một endpoint luôn nằm trong ngân sách truy vấn cố
+định bất kể số dòng kết quả:
+
+    response = client.get("/api/orders/", headers=auth)
+    assert int(response.headers["X-Query-Count"]) <= 3
+
+QUERY_BUDGET=n ghi log (kèm các câu SQL) khi một request chạy quá n câu. Không
+bật biến nào thì middleware không làm gì. Nội dung câu SQL chỉ được lưu khi
+QUERY_BUDGET được đặt hoặc khi gọi `count_queries(record=True)` / `query_budget(n)`
+trong code đồng bộ (script, test gọi hàm trực tiếp).
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional
+
+from sqlalchemy import event
+
+from app.database import engine
+
+# Cảnh báo khi một request vượt quá số câu SQL này (0 = tắt)
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "0"))
+# Trả header X-Query-Count (chỉ nên bật khi dev/test)
+QUERY_COUNT_HEADER = os.getenv("QUERY_COUNT_HEADER", "0") == "1"
+# Không đếm file tĩnh / thumbnail (không chạm tới SQL đáng kể)
+SKIP_PATHS = ("/static/", "/img/")
+
+
+class QueryCounter:
+    __slots__ = ("count", "statements")
+
+    def __init__(self, record: bool = False):
+        self.count = 0
+        # None = chỉ đếm, không giữ nội dung câu SQL
+        self.statements: Optional[List[str]] = [] if record else None
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+_current: ContextVar[Optional[QueryCounter]] = ContextVar("query_counter", default=None)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _current.get()
+    if counter is not None:
+        counter.count += 1
+        if counter.statements is not None:
+            counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries(record: bool = False):
+    """Đếm các câu SQL chạy trong khối with (record=True: giữ cả nội dung câu lệnh)"""
+    counter = QueryCounter(record)
+    token = _current.set(counter)
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def query_budget(limit: int):
+    """Báo lỗi nếu khối with chạy quá `limit` câu SQL"""
+    with count_queries(record=True) as counter:
+        yield counter
+    if counter.count > limit:
+        raise QueryBudgetExceeded(
+            f"{counter.count} queries > budget {limit}:\n" + "\n".join(counter.statements)
+        )
+
+
+class QueryCountMiddleware:
+    """ASGI middleware: đếm câu SQL của mỗi request (header X-Query-Count / cảnh báo QUERY_BUDGET)"""
+
+    def __init__(self, app, header: bool = QUERY_COUNT_HEADER, budget: int = QUERY_BUDGET):
+        self.app = app
+        self.header = header
+        self.budget = budget
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not (self.header or self.budget)
+            or scope["path"].startswith(SKIP_PATHS)
+        ):
+            return await self.app(scope, receive, send)
+
+        # Endpoint đồng bộ chạy trong threadpool với bản sao context,
+        # vẫn trỏ tới cùng đối tượng counter nên số đếm được cộng dồn
+        counter = QueryCounter(record=bool(self.budget))
+        token = _current.set(counter)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                if self.header:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-query-count", str(counter.count).encode()))
+                    message = {**message, "headers": headers}
+                if self.budget and counter.count > self.budget:
+                    print(f"!!! Query budget exceeded: {scope['path']} ran {counter.count} queries "
+                          f"(budget {self.budget}):\n" + "\n".join(counter.statements))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _current.reset(token)
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.models import Cart, CartItem, Book, SessionLocal
+from app.models import Book, SessionLocal
+from app.cart_store import CartConflict, cart_backend
+from app.serialization import FastJSONResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 import uuid
 
 router = APIRouter()
@@ -14,16 +16,6 @@ def get_db():
     finally:
         db.close()
 
-def get_or_create_cart(session_id: str, db: Session) -> Cart:
-    """Lấy hoặc tạo giỏ hàng"""
-    cart = db.query(Cart).filter(Cart.session_id == session_id).first()
-    if not cart:
-        cart = Cart(session_id=session_id)
-        db.add(cart)
-        db.commit()
-        db.refresh(cart)
-    return cart
-
 class CartItemRequest(BaseModel):
     book_id: int
     quantity: int = 1
@@ -36,7 +28,7 @@ class CartItemResponse(BaseModel):
     book_price: float
     book_image: Optional[str]
     subtotal: float
-    
+
     class Config:
         from_attributes = True
 
@@ -46,6 +38,81 @@ class CartResponse(BaseModel):
     items: List[CartItemResponse]
     total: float
 
+class CartSummaryResponse(BaseModel):
+    count: int
+    items: int
+    total: float
+
+class CartOperation(BaseModel):
+    op: Literal["add", "set", "remove"]
+    item_id: Optional[int] = None
+    book_id: Optional[int] = None
+    quantity: int = 1
+
+class CartPatchRequest(BaseModel):
+    operations: List[CartOperation]
+
+MAX_CART_OPERATIONS = 100
+# Số lần đọc lại giỏ khi request khác ghi chen vào giữa lúc đọc và lúc ghi
+MAX_CART_RETRIES = 5
+
+def resolve_operations(cart_id, lines, operations: List[CartOperation], db: Session) -> Dict[int, int]:
+    """Số lượng cuối cùng của từng sách bị tác động, tính từ giỏ `lines` vừa đọc"""
+    items_by_id = {item_id: (book_id, quantity) for item_id, book_id, quantity in lines}
+    current = {book_id: quantity for _, book_id, quantity in lines}
+
+    # Số lượng cuối cùng của từng sách bị tác động, sau khi áp dụng lần lượt các thao tác
+    quantities: Dict[int, int] = {}
+    for operation in operations:
+        if operation.item_id is not None:
+            if operation.item_id not in items_by_id:
+                detail = "Giỏ hàng không tồn tại" if cart_id is None else "Item không tồn tại"
+                raise HTTPException(status_code=404, detail=detail)
+            book_id = items_by_id[operation.item_id][0]
+        elif operation.book_id is not None:
+            book_id = operation.book_id
+        else:
+            raise HTTPException(status_code=400, detail="Thiếu item_id hoặc book_id")
+
+        if operation.op == "add":
+            if operation.quantity < 1:
+                raise HTTPException(status_code=400, detail="Số lượng không hợp lệ")
+            quantities[book_id] = quantities.get(book_id, current.get(book_id, 0)) + operation.quantity
+        elif operation.op == "set":
+            if operation.quantity < 0:
+                raise HTTPException(status_code=400, detail="Số lượng không hợp lệ")
+            quantities[book_id] = operation.quantity
+        else:
+            quantities[book_id] = 0
+
+    # Kiểm tra tồn kho mọi sách liên quan trong một câu SQL
+    wanted = {book_id for book_id, quantity in quantities.items() if quantity > 0}
+    stock = dict(db.query(Book.id, Book.stock).filter(
+        Book.id.in_(wanted), Book.is_active == True
+    ).all()) if wanted else {}
+    for book_id in wanted:
+        if book_id not in stock:
+            raise HTTPException(status_code=404, detail="Sách không tồn tại")
+        if quantities[book_id] > stock[book_id]:
+            raise HTTPException(status_code=400, detail=f"Số lượng vượt quá tồn kho (sách #{book_id})")
+
+    if cart_id is None and not wanted:
+        raise HTTPException(status_code=404, detail="Giỏ hàng không tồn tại")
+    return quantities
+
+def apply_operations(session_id: str, operations: List[CartOperation], db: Session):
+    """Áp dụng các thao tác add/set/remove lên giỏ hàng, tất cả hoặc không gì cả"""
+    for _ in range(MAX_CART_RETRIES):
+        cart_id, lines = cart_backend.lines(session_id, db)
+        quantities = resolve_operations(cart_id, lines, operations, db)
+        try:
+            cart_backend.apply(session_id, quantities, db, cart_id=cart_id, lines=lines)
+            return
+        except CartConflict:
+            # Request khác vừa sửa cùng sách trong giỏ -> đọc lại và tính lại
+            continue
+    raise HTTPException(status_code=409, detail="Giỏ hàng đang được cập nhật, vui lòng thử lại")
+
 @router.post("/add")
 def add_to_cart(
     item: CartItemRequest,
@@ -55,73 +122,67 @@ def add_to_cart(
     """Thêm sách vào giỏ hàng"""
     if not session_id:
         session_id = str(uuid.uuid4())
-    
-    # Kiểm tra sách tồn tại
-    book = db.query(Book).filter(Book.id == item.book_id, Book.is_active == True).first()
-    if not book:
-        raise HTTPException(status_code=404, detail="Sách không tồn tại")
-    
-    if book.stock < item.quantity:
-        raise HTTPException(status_code=400, detail="Số lượng không đủ")
-    
-    # Lấy hoặc tạo giỏ hàng
-    cart = get_or_create_cart(session_id, db)
-    
-    # Kiểm tra item đã có trong giỏ chưa
-    existing_item = db.query(CartItem).filter(
-        CartItem.cart_id == cart.id,
-        CartItem.book_id == item.book_id
-    ).first()
-    
-    if existing_item:
-        existing_item.quantity += item.quantity
-        if existing_item.quantity > book.stock:
-            raise HTTPException(status_code=400, detail="Số lượng vượt quá tồn kho")
-    else:
-        cart_item = CartItem(
-            cart_id=cart.id,
-            book_id=item.book_id,
-            quantity=item.quantity
-        )
-        db.add(cart_item)
-    
-    db.commit()
+
+    apply_operations(session_id, [CartOperation(op="add", book_id=item.book_id, quantity=item.quantity)], db)
     return {"message": "Đã thêm vào giỏ hàng", "session_id": session_id}
 
+@router.get("/summary", response_model=CartSummaryResponse)
+def get_cart_summary(session_id: Optional[str] = None, db: Session = Depends(get_db)):
+    """Tổng số lượng và tổng tiền (cho badge giỏ hàng) trong một câu SQL"""
+    if not session_id:
+        return FastJSONResponse({"count": 0, "items": 0, "total": 0.0})
+
+    count, items, total = cart_backend.summary(session_id, db)
+    return FastJSONResponse({"count": count, "items": items, "total": total})
+
 @router.get("/", response_model=CartResponse)
 def get_cart(session_id: Optional[str] = None, db: Session = Depends(get_db)):
     """Lấy giỏ hàng"""
     if not session_id:
-        return CartResponse(id=0, session_id="", items=[], total=0.0)
-    
-    cart = db.query(Cart).filter(Cart.session_id == session_id).first()
-    if not cart:
-        return CartResponse(id=0, session_id=session_id, items=[], total=0.0)
-    
+        return FastJSONResponse({"id": 0, "session_id": "", "items": [], "total": 0.0})
+
+    cart_id, rows = cart_backend.read(session_id, db)
+    if cart_id is None:
+        return FastJSONResponse({"id": 0, "session_id": session_id, "items": [], "total": 0.0})
+
     items = []
     total = 0.0
-    
-    for item in cart.items:
-        book = item.book
-        subtotal = book.price_vnd * item.quantity
+
+    for row in rows:
+        subtotal = row.price_vnd * row.quantity
         total += subtotal
-        
-        items.append(CartItemResponse(
-            id=item.id,
-            book_id=item.book_id,
-            quantity=item.quantity,
-            book_title=book.title,
-            book_price=book.price_vnd,
-            book_image=book.image_url,
-            subtotal=subtotal
-        ))
-    
-    return CartResponse(
-        id=cart.id,
-        session_id=cart.session_id,
-        items=items,
-        total=total
-    )
+
+        items.append({
+            "id": row.id,
+            "book_id": row.book_id,
+            "quantity": row.quantity,
+            "book_title": row.title,
+            "book_price": row.price_vnd,
+            "book_image": row.image_url,
+            "subtotal": subtotal
+        })
+
+    return FastJSONResponse({
+        "id": cart_id,
+        "session_id": session_id,
+        "items": items,
+        "total": total
+    })
+
+@router.patch("/", response_model=CartResponse)
+def patch_cart(
+    request: CartPatchRequest,
+    session_id: str,
+    db: Session = Depends(get_db)
+):
+    """Áp dụng nhiều thao tác add/set/remove trong một transaction, trả về giỏ hàng mới"""
+    if not request.operations:
+        raise HTTPException(status_code=400, detail="Không có thao tác nào")
+    if len(request.operations) > MAX_CART_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"Tối đa {MAX_CART_OPERATIONS} thao tác mỗi lần")
+
+    apply_operations(session_id, request.operations, db)
+    return get_cart(session_id, db)
 
 @router.put("/item/{item_id}")
 def update_cart_item(
@@ -131,44 +192,11 @@ def update_cart_item(
     db: Session = Depends(get_db)
 ):
     """Cập nhật số lượng item trong giỏ"""
-    cart = db.query(Cart).filter(Cart.session_id == session_id).first()
-    if not cart:
-        raise HTTPException(status_code=404, detail="Giỏ hàng không tồn tại")
-    
-    cart_item = db.query(CartItem).filter(
-        CartItem.id == item_id,
-        CartItem.cart_id == cart.id
-    ).first()
-    
-    if not cart_item:
-        raise HTTPException(status_code=404, detail="Item không tồn tại")
-    
-    if quantity <= 0:
-        db.delete(cart_item)
-    else:
-        if cart_item.book.stock < quantity:
-            raise HTTPException(status_code=400, detail="Số lượng không đủ")
-        cart_item.quantity = quantity
-    
-    db.commit()
+    apply_operations(session_id, [CartOperation(op="set", item_id=item_id, quantity=max(quantity, 0))], db)
     return {"message": "Đã cập nhật"}
 
 @router.delete("/item/{item_id}")
 def remove_cart_item(item_id: int, session_id: str, db: Session = Depends(get_db)):
     """Xóa item khỏi giỏ hàng"""
-    cart = db.query(Cart).filter(Cart.session_id == session_id).first()
-    if not cart:
-        raise HTTPException(status_code=404, detail="Giỏ hàng không tồn tại")
-    
-    cart_item = db.query(CartItem).filter(
-        CartItem.id == item_id,
-        CartItem.cart_id == cart.id
-    ).first()
-    
-    if not cart_item:
-        raise HTTPException(status_code=404, detail="Item không tồn tại")
-    
-    db.delete(cart_item)
-    db.commit()
+    apply_operations(session_id, [CartOperation(op="remove", item_id=item_id)], db)
     return {"message": "Đã xóa"}
-
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
+from sqlalchemy import bindparam, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
-from app.models import Cart, Order, OrderItem, Book, SessionLocal
+from app.models import Cart, CartItem, Order, OrderItem, OrderSequence, Book, SessionLocal
+from app.cart_store import cart_backend, current_cart_id
+from app.catalog_events import notify_stock
+from app.idempotency import IN_PROGRESS, MAX_KEY_LENGTH, MISMATCH, REPLAY, checkout_keys, fingerprint
+from app.serialization import FastJSONResponse, dumps
+from app.task_queue import task_queue
+from app.tasks import enqueue_order_followups
 from pydantic import BaseModel
 from typing import Optional
 from datetime import datetime
-import random
-import string
 
 router = APIRouter()
 
@@ -35,44 +41,113 @@ class OrderResponse(BaseModel):
     class Config:
         from_attributes = True
 
-def generate_order_number() -> str:
-    """Tạo mã đơn hàng"""
-    timestamp = datetime.now().strftime("%Y%m%d")
-    random_str = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    return f"ORD-{timestamp}-{random_str}"
+books_table = Book.__table__
+
+# stock = stock - :qty WHERE id = :b_id AND stock >= :qty
+DECREMENT_STOCK = update(books_table).where(
+    books_table.c.id == bindparam("b_id"),
+    books_table.c.stock >= bindparam("qty"),
+).values(stock=books_table.c.stock - bindparam("qty"))
+
+# Số thứ tự trong ngày được đệm tới độ dài này để mã đơn sắp xếp được theo chuỗi
+ORDER_SEQUENCE_WIDTH = 6
+
+def generate_order_number(db: Session) -> str:
+    """
+    Tạo mã đơn hàng ORD-YYYYMMDD-000001, tăng dần trong ngày.
+
+    Bộ đếm nằm trong bảng order_sequences và được tăng bằng một câu UPSERT ...
+    RETURNING trong chính transaction checkout (sau khi đã giữ khóa ghi), nên
+    nhiều worker/process không bao giờ nhận trùng số và không cần thử lại.
+    Mã tăng dần cũng giúp index order_number chỉ ghi vào cuối cây B-tree.
+    """
+    day = datetime.now().strftime("%Y%m%d")
+    statement = sqlite_insert(OrderSequence).values(day=day, last_value=1)
+    statement = statement.on_conflict_do_update(
+        index_elements=[OrderSequence.day],
+        set_={"last_value": OrderSequence.last_value + 1},
+    ).returning(OrderSequence.last_value)
+    sequence = db.execute(statement).scalar_one()
+    return f"ORD-{day}-{sequence:0{ORDER_SEQUENCE_WIDTH}d}"
 
 @router.post("/", response_model=OrderResponse)
-def create_order(checkout_data: CheckoutRequest, db: Session = Depends(get_db)):
-    """Tạo đơn hàng"""
-    # Lấy giỏ hàng
-    cart = db.query(Cart).filter(Cart.session_id == checkout_data.session_id).first()
-    if not cart or not cart.items:
+def create_order(
+    checkout_data: CheckoutRequest,
+    db: Session = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Tạo đơn hàng (gửi lại cùng Idempotency-Key sẽ nhận lại đúng đơn đã tạo)"""
+    if not idempotency_key:
+        return place_order(checkout_data, db)
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key quá dài")
+
+    # Kiểm tra trước khi chạm tới database
+    state, entry = checkout_keys.begin(idempotency_key, fingerprint(checkout_data.model_dump_json().encode()))
+    if state == REPLAY:
+        return FastJSONResponse(entry.body, status_code=entry.status_code, headers={"Idempotent-Replayed": "true"})
+    if state == IN_PROGRESS:
+        raise HTTPException(status_code=409, detail="Đơn hàng đang được xử lý, vui lòng chờ")
+    if state == MISMATCH:
+        raise HTTPException(status_code=422, detail="Idempotency-Key đã được dùng cho một đơn hàng khác")
+
+    try:
+        order = place_order(checkout_data, db)
+    except BaseException:
+        checkout_keys.release(idempotency_key)
+        raise
+    body = dumps(order.model_dump())
+    checkout_keys.complete(idempotency_key, body)
+    return FastJSONResponse(body)
+
+def place_order(checkout_data: CheckoutRequest, db: Session) -> OrderResponse:
+    """Tạo đơn hàng từ giỏ hàng của session"""
+    # Ghi nốt thay đổi giỏ hàng còn trong bộ nhớ (CART_BACKEND=memory) rồi đọc từ DB
+    cart_backend.flush(checkout_data.session_id)
+    
+    # Lấy giỏ hàng kèm giá/tồn kho của sách (một câu JOIN, chưa giữ khóa ghi)
+    lines = db.query(
+        Cart.id.label("cart_id"),
+        CartItem.book_id,
+        CartItem.quantity,
+        Book.title,
+        Book.authors,
+        Book.image_url,
+        Book.price_vnd,
+        Book.stock,
+    ).select_from(Cart).join(
+        CartItem, CartItem.cart_id == Cart.id
+    ).join(
+        Book, CartItem.book_id == Book.id
+    ).filter(Cart.id == current_cart_id(checkout_data.session_id)).all()
+    if not lines:
         raise HTTPException(status_code=400, detail="Giỏ hàng trống")
     
-    # Kiểm tra tồn kho và tính tổng
+    # Kiểm tra sơ bộ và tính tổng (kiểm tra thật nằm ở câu UPDATE có điều kiện)
     total = 0.0
-    order_items_data = []
-    
-    for item in cart.items:
-        book = item.book
-        if book.stock < item.quantity:
+    for line in lines:
+        if line.stock < line.quantity:
             raise HTTPException(
                 status_code=400, 
-                detail=f"Sách '{book.title}' không đủ số lượng"
+                detail=f"Sách '{line.title}' không đủ số lượng"
             )
-        
-        subtotal = book.price_vnd * item.quantity
-        total += subtotal
-        
-        order_items_data.append({
-            "book_id": book.id,
-            "quantity": item.quantity,
-            "price_vnd": book.price_vnd
-        })
+        total += line.price_vnd * line.quantity
+    
+    # Giảm tồn kho nguyên tử: chỉ trừ khi còn đủ hàng, một lần executemany.
+    # Câu ghi đầu tiên của transaction -> khóa ghi SQLite chỉ bị giữ từ đây tới commit.
+    stock_params = [{"b_id": line.book_id, "qty": line.quantity} for line in lines]
+    updated = db.execute(DECREMENT_STOCK, stock_params).rowcount
+    if updated != len(lines):
+        db.rollback()
+        short = db.query(Book.title).filter(
+            or_(*[(Book.id == line.book_id) & (Book.stock < line.quantity) for line in lines])
+        ).first()
+        title = short.title if short else lines[0].title
+        raise HTTPException(status_code=400, detail=f"Sách '{title}' không đủ số lượng")
     
     # Tạo đơn hàng
     order = Order(
-        order_number=generate_order_number(),
+        order_number=generate_order_number(db),
         session_id=checkout_data.session_id,
         user_id=checkout_data.user_id,
         customer_name=checkout_data.customer_name,
@@ -86,24 +161,34 @@ def create_order(checkout_data: CheckoutRequest, db: Session = Depends(get_db)):
     db.add(order)
     db.flush()
     
-    # Tạo order items và giảm tồn kho
-    for item_data in order_items_data:
-        order_item = OrderItem(
+    db.add_all([
+        OrderItem(
             order_id=order.id,
-            book_id=item_data["book_id"],
-            quantity=item_data["quantity"],
-            price_vnd=item_data["price_vnd"]
+            book_id=line.book_id,
+            quantity=line.quantity,
+            price_vnd=line.price_vnd,
+            book_title=line.title,
+            book_authors=line.authors,
+            book_image_url=line.image_url
         )
-        db.add(order_item)
-        
-        # Giảm tồn kho
-        book = db.query(Book).filter(Book.id == item_data["book_id"]).first()
-        book.stock -= item_data["quantity"]
+        for line in lines
+    ])
     
     # Xóa giỏ hàng
-    db.delete(cart)
+    cart_id = lines[0].cart_id
+    db.query(CartItem).filter(CartItem.cart_id == cart_id).delete(synchronize_session=False)
+    db.query(Cart).filter(Cart.id == cart_id).delete(synchronize_session=False)
+    
+    # Webhook tồn kho, thông báo, thống kê: ghi job cùng transaction, chạy ở worker nền
+    book_ids = {line.book_id for line in lines}
+    enqueue_order_followups(db, order, book_ids)
     
     db.commit()
+    task_queue.wake()
+    cart_backend.discard(checkout_data.session_id)
+    # UPDATE bằng SQL thuần không qua ORM -> tự phát sự kiện; chỉ tồn kho đổi nên
+    # cache đếm/facet và ETag của catalog được giữ, chỉ các sách này được làm mới
+    notify_stock(book_ids)
     db.refresh(order)
     
     return OrderResponse(
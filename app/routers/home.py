@@ -0,0 +1,85 @@
+"""Aggregated homepage data"""
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from sqlalchemy import select, literal, null, union_all
+from app.models import Book, Category, SessionLocal
+from app.pagination import apply_sort
+from app.cache import CatalogCache, MISSING
+from app.serialization import FastJSONResponse, dumps, CARD_FIELDS
+
+router = APIRouter()
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Payload trang chủ giống nhau với mọi khách -> cache dạng bytes đã serialize
+HOME_CACHE_TTL = 30
+home_cache = CatalogCache("home", maxsize=1, ttl=HOME_CACHE_TTL, stock=True)
+
+LITERATURE_SLUG = "van-hoc"
+
+# (tên section, sort_by, số lượng, chỉ lấy danh mục văn học?)
+SECTIONS = [
+    ("hero", "default", 3, False),
+    ("featured", "default", 8, False),
+    ("new", "newest", 4, False),
+    ("literature", "newest", 4, True),
+]
+
+CARD_COLUMNS = tuple(f for f in CARD_FIELDS if f != "category_name")
+
+def _section_select(db: Session, name: str, sort_by: str, limit: int, literature: bool):
+    query = db.query(
+        literal(name).label("section"),
+        *[getattr(Book, column) for column in CARD_COLUMNS],
+        Category.name.label("category_name"),
+        null().label("slug"),
+    ).select_from(Book).outerjoin(Category, Book.category_id == Category.id).filter(Book.is_active == True)
+    if literature:
+        query = query.filter(Category.slug == LITERATURE_SLUG)
+    return apply_sort(query, sort_by).limit(limit).subquery()
+
+def _categories_select(db: Session):
+    return db.query(
+        literal("categories").label("section"),
+        Category.id.label("id"),
+        *[null().label(column) for column in CARD_COLUMNS[1:]],
+        Category.name.label("category_name"),
+        Category.slug.label("slug"),
+    ).order_by(Category.id).subquery()
+
+def build_home(db: Session) -> dict:
+    """Gom mọi section trang chủ trong một câu lệnh UNION ALL"""
+    parts = [_section_select(db, *section) for section in SECTIONS] + [_categories_select(db)]
+    rows = db.execute(union_all(*[select(*part.c) for part in parts])).all()
+
+    home = {name: [] for name, *_ in SECTIONS}
+    home["categories"] = []
+    for row in rows:
+        if row.section == "categories":
+            home["categories"].append({"id": row.id, "name": row.category_name, "slug": row.slug})
+        else:
+            book = {column: getattr(row, column) for column in CARD_COLUMNS}
+            book["category_name"] = row.category_name
+            home[row.section].append(book)
+
+    # Chưa có danh mục văn học: giữ hành vi cũ (sách nổi bật phía sau)
+    if not home["literature"]:
+        home["literature"] = home["featured"][4:8]
+    return home
+
+@router.get("/", response_model=dict)
+def get_home(db: Session = Depends(get_db)):
+    """Dữ liệu trang chủ: hero, danh mục, nổi bật, sách mới, văn học"""
+    body = home_cache.get("home")
+    if body is MISSING:
+        body = dumps(build_home(db))
+        home_cache.set("home", body)
+    return FastJSONResponse(
+        body,
+        headers={"Cache-Control": f"public, max-age={HOME_CACHE_TTL}"}
+    )
@@ -0,0 +1,62 @@
+"""Thumbnail ảnh bìa sách"""
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, RedirectResponse
+from sqlalchemy.orm import Session
+
+from app.models import Book, SessionLocal
+from app.catalog_snapshot import catalog_snapshot
+from app.thumbnails import FORMATS, PLACEHOLDER_URL, SIZES, Image, negotiate_format, thumbnail_cache
+
+router = APIRouter()
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# URL không đổi khi sách đổi ảnh (tên file cache thì đổi) -> không dùng immutable
+THUMBNAIL_CACHE_CONTROL = "public, max-age=86400"
+
+def get_image_url(book_id: int, db: Session):
+    if catalog_snapshot.enabled:
+        book = catalog_snapshot.get(book_id)
+        if book is None:
+            raise HTTPException(status_code=404, detail="Sách không tồn tại")
+        return book.image_url
+    row = db.query(Book.image_url).filter(Book.id == book_id, Book.is_active == True).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Sách không tồn tại")
+    return row.image_url
+
+@router.get("/{book_id}/{size}")
+async def get_thumbnail(book_id: int, size: str, request: Request, db: Session = Depends(get_db)):
+    """Ảnh bìa thu nhỏ: size = sm, md, lg"""
+    if size not in SIZES:
+        raise HTTPException(status_code=404, detail=f"Kích thước không hợp lệ, chọn: {', '.join(SIZES)}")
+    # Truy vấn DB chạy trong threadpool, event loop chỉ chờ
+    image_url = await run_in_threadpool(get_image_url, book_id, db)
+
+    # Sách chưa có ảnh: dùng thẳng ảnh placeholder. Chưa cài Pillow: dùng ảnh gốc
+    if not image_url:
+        return RedirectResponse(PLACEHOLDER_URL)
+    if Image is None:
+        return RedirectResponse(image_url)
+
+    fmt = negotiate_format(request.headers.get("accept"))
+    future = thumbnail_cache.submit(book_id, size, fmt, image_url)
+    try:
+        path = await asyncio.wrap_future(future)
+    except Exception:
+        # Lỗi đã được ghi log (một lần) và nhớ tạm trong thumbnail_cache
+        return RedirectResponse(image_url)
+
+    return FileResponse(
+        path,
+        media_type=FORMATS[fmt][1],
+        headers={"Cache-Control": THUMBNAIL_CACHE_CONTROL, "Vary": "Accept"},
+    )
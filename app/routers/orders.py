@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, joinedload
 from app.database import Order, OrderItem, SessionLocal
 from app.routers.auth import get_current_active_user
+from app.serialization import FastJSONResponse
 from app.database import User
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
+import base64
 
 router = APIRouter()
 
@@ -18,8 +21,10 @@ def get_db():
 
 class OrderItemResponse(BaseModel):
     id: int
-    book_id: int
+    book_id: Optional[int]
     book_title: str
+    book_authors: Optional[str] = None
+    book_image_url: Optional[str] = None
     quantity: int
     price_vnd: float
     subtotal: float
@@ -43,76 +48,112 @@ class OrderResponse(BaseModel):
     class Config:
         from_attributes = True
 
-@router.get("/", response_model=List[OrderResponse])
-async def get_my_orders(
+class OrderSummaryResponse(BaseModel):
+    id: int
+    order_number: str
+    total: float
+    status: str
+    created_at: datetime
+    item_count: int
+
+# Dòng cũ chưa backfill mà sách đã bị xóa (scripts/migrate_order_item_snapshot.py)
+DELETED_BOOK_TITLE = "Sách không còn tồn tại"
+
+def serialize_order(order: Order) -> dict:
+    """Order -> dict theo OrderResponse (không qua Pydantic)"""
+    return {
+        "id": order.id,
+        "order_number": order.order_number,
+        "customer_name": order.customer_name,
+        "customer_phone": order.customer_phone,
+        "customer_address": order.customer_address,
+        "shipping_method": order.shipping_method,
+        "payment_method": order.payment_method,
+        "total": order.total,
+        "status": order.status,
+        "created_at": order.created_at,
+        "items": [
+            {
+                "id": item.id,
+                "book_id": item.book_id,
+                "book_title": item.book_title or DELETED_BOOK_TITLE,
+                "book_authors": item.book_authors,
+                "book_image_url": item.book_image_url,
+                "quantity": item.quantity,
+                "price_vnd": item.price_vnd,
+                "subtotal": item.price_vnd * item.quantity
+            }
+            for item in order.items
+        ]
+    }
+
+# Số dòng item của đơn, tính trong SQL (dùng index order_items.order_id)
+ITEM_COUNT = select(func.count(OrderItem.id)).where(
+    OrderItem.order_id == Order.id
+).correlate(Order).scalar_subquery()
+
+def encode_order_cursor(order_id: int) -> str:
+    return base64.urlsafe_b64encode(str(order_id).encode()).decode().rstrip("=")
+
+def decode_order_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+
+@router.get("/", response_model=List[OrderSummaryResponse])
+def get_my_orders(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (header X-Next-Cursor)"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Lấy danh sách đơn hàng của user hiện tại"""
-    orders = db.query(Order).filter(Order.user_id == current_user.id).order_by(Order.created_at.desc()).all()
-    
-    result = []
-    for order in orders:
-        items = []
-        for item in order.items:
-            items.append(OrderItemResponse(
-                id=item.id,
-                book_id=item.book_id,
-                book_title=item.book.title,
-                quantity=item.quantity,
-                price_vnd=item.price_vnd,
-                subtotal=item.price_vnd * item.quantity
-            ))
-        
-        result.append(OrderResponse(
-            id=order.id,
-            order_number=order.order_number,
-            customer_name=order.customer_name,
-            customer_phone=order.customer_phone,
-            customer_address=order.customer_address,
-            shipping_method=order.shipping_method,
-            payment_method=order.payment_method,
-            total=order.total,
-            status=order.status,
-            created_at=order.created_at,
-            items=items
-        ))
+    """
+    Lịch sử đơn hàng của user hiện tại, mới nhất trước, phân trang theo cursor.
+
+    Chỉ trả về tóm tắt (không có item); chi tiết lấy qua GET /{order_id}.
+    id tăng theo thời gian tạo nên sắp xếp/keyset theo id tương đương created_at
+    và đi thẳng theo index (user_id, id).
+    """
+    query = db.query(
+        Order.id,
+        Order.order_number,
+        Order.total,
+        Order.status,
+        Order.created_at,
+        ITEM_COUNT.label("item_count"),
+    ).filter(Order.user_id == current_user.id)
+    if cursor:
+        query = query.filter(Order.id < decode_order_cursor(cursor))
+    rows = query.order_by(Order.id.desc()).limit(limit).all()
     
-    return result
+    response = FastJSONResponse([
+        {
+            "id": row.id,
+            "order_number": row.order_number,
+            "total": row.total,
+            "status": row.status,
+            "created_at": row.created_at,
+            "item_count": row.item_count,
+        }
+        for row in rows
+    ])
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_order_cursor(rows[-1].id)
+    return response
 
 @router.get("/{order_id}", response_model=OrderResponse)
-async def get_order_detail(
+def get_order_detail(
     order_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Lấy chi tiết đơn hàng"""
-    order = db.query(Order).filter(Order.id == order_id, Order.user_id == current_user.id).first()
+    """Lấy chi tiết đơn hàng (đơn và item trong một câu JOIN, không đọc bảng books)"""
+    order = db.query(Order).options(
+        joinedload(Order.items)
+    ).filter(Order.id == order_id, Order.user_id == current_user.id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Đơn hàng không tồn tại")
     
-    items = []
-    for item in order.items:
-        items.append(OrderItemResponse(
-            id=item.id,
-            book_id=item.book_id,
-            book_title=item.book.title,
-            quantity=item.quantity,
-            price_vnd=item.price_vnd,
-            subtotal=item.price_vnd * item.quantity
-        ))
-    
-    return OrderResponse(
-        id=order.id,
-        order_number=order.order_number,
-        customer_name=order.customer_name,
-        customer_phone=order.customer_phone,
-        customer_address=order.customer_address,
-        shipping_method=order.shipping_method,
-        payment_method=order.payment_method,
-        total=order.total,
-        status=order.status,
-        created_at=order.created_at,
-        items=items
-    )
-
+    return FastJSONResponse(serialize_order(order))
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.models import Book, Category, SessionLocal
+from app.pagination import SORT_COLUMNS, apply_sort, apply_cursor, next_cursor
+from app.catalog_snapshot import catalog_snapshot
+from app.serialization import FastJSONResponse, book_fragments, project_books, join_fragments, splice_list, resolve_fields
 from typing import Optional, List
 from pydantic import BaseModel
 
@@ -31,53 +34,161 @@ class BookResponse(BaseModel):
     class Config:
         from_attributes = True
 
-@router.get("/", response_model=List[BookResponse])
+class BookCardResponse(BaseModel):
+    """
+    Một sách trong danh sách: mặc định trả các trường thẻ sách (fields=card).
+    fields=full thêm description, pages, publisher, publish_year; fields=id,title,...
+    chỉ trả các trường được chọn.
+    """
+    id: int
+    title: str
+    authors: str
+    price_vnd: float
+    stock: int
+    image_url: Optional[str]
+    rating_avg: float
+    category_id: Optional[int]
+    category_name: Optional[str] = None
+    description: Optional[str] = None
+    pages: Optional[int] = None
+    publisher: Optional[str] = None
+    publish_year: Optional[int] = None
+
+@router.get("/", response_model=List[BookCardResponse])
 def get_products(
     category_id: Optional[int] = None,
-    limit: int = 20,
-    offset: int = 0,
+    sort_by: str = Query("default", description="Sắp xếp: default, newest, price_asc, price_desc, rating"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (header X-Next-Cursor)"),
+    fields: Optional[str] = Query(None, description="Trường trả về: card (mặc định), full hoặc danh sách id,title,..."),
     db: Session = Depends(get_db)
 ):
     """Lấy danh sách sách"""
-    query = db.query(Book).filter(Book.is_active == True)
+    if sort_by not in SORT_COLUMNS:
+        sort_by = "default"
+    fields = resolve_fields(fields)
+    generation = book_fragments.generation()
+    
+    # Đọc từ snapshot trong bộ nhớ nếu được bật (không chạy SQL)
+    if catalog_snapshot.enabled:
+        books, next_page = catalog_snapshot.page(category_id, sort_by, limit, offset, cursor)
+    else:
+        query = db.query(Book).filter(Book.is_active == True)
+        
+        if category_id:
+            query = query.filter(Book.category_id == category_id)
+        
+        query = project_books(apply_sort(query, sort_by), fields)
+        
+        # Cursor (keyset) được ưu tiên, offset giữ lại cho client cũ
+        if cursor:
+            books = apply_cursor(query, sort_by, cursor).limit(limit).all()
+        else:
+            books = query.offset(offset).limit(limit).all()
+        next_page = next_cursor(books, sort_by, limit)
     
-    if category_id:
-        query = query.filter(Book.category_id == category_id)
+    response = FastJSONResponse(join_fragments(book_fragments.encode(books, fields, generation=generation)))
+    if next_page:
+        response.headers["X-Next-Cursor"] = next_page
+    return response
+
+# Số id tối đa cho một lần tra cứu hàng loạt
+BATCH_LIMIT = 200
+
+class BatchRequest(BaseModel):
+    ids: List[int]
+
+class BatchResponse(BaseModel):
+    books: List[BookResponse]
+    missing: List[int]
+    inactive: List[int]
+
+def parse_ids(raw: str) -> List[int]:
+    """Tách chuỗi "1,2,3" thành danh sách id"""
+    try:
+        return [int(part) for part in raw.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Danh sách id không hợp lệ")
+
+def lookup_books(ids: List[int], db: Session) -> FastJSONResponse:
+    """Tra cứu nhiều sách bằng một câu IN, giữ thứ tự yêu cầu và báo id thiếu/ngừng bán"""
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Tối đa {BATCH_LIMIT} id mỗi lần")
     
-    books = query.offset(offset).limit(limit).all()
+    generation = book_fragments.generation()
+    found = {
+        row.id: row
+        for row in project_books(db.query(Book)).add_columns(Book.is_active).filter(Book.id.in_(ids))
+    } if ids else {}
     
-    result = []
-    for book in books:
-        book_dict = BookResponse.model_validate(book).model_dump()
-        if book.category:
-            book_dict["category_name"] = book.category.name
-        result.append(book_dict)
+    books, missing, inactive = [], [], []
+    for book_id in ids:
+        row = found.get(book_id)
+        if row is None:
+            missing.append(book_id)
+        elif not row.is_active:
+            inactive.append(book_id)
+        else:
+            books.append(row)
     
-    return result
+    body = splice_list(
+        {"missing": missing, "inactive": inactive},
+        "books",
+        book_fragments.encode(books, generation=generation)
+    )
+    return FastJSONResponse(body)
+
+@router.get("/batch", response_model=BatchResponse)
+def get_products_batch(
+    ids: str = Query(..., description="Danh sách id, cách nhau bởi dấu phẩy"),
+    db: Session = Depends(get_db)
+):
+    """Lấy nhiều sách theo id"""
+    return lookup_books(parse_ids(ids), db)
+
+@router.post("/batch", response_model=BatchResponse)
+def post_products_batch(request: BatchRequest, db: Session = Depends(get_db)):
+    """Lấy nhiều sách theo id (dạng POST cho danh sách dài)"""
+    return lookup_books(request.ids, db)
+
+def find_product(book_id: int, db: Session):
+    """Sách đang bán (các trường của BookResponse), None nếu không có; dùng chung với app/ssr.py"""
+    if catalog_snapshot.enabled:
+        return catalog_snapshot.get(book_id)
+    return project_books(db.query(Book)).filter(Book.id == book_id, Book.is_active == True).first()
 
 @router.get("/{book_id}", response_model=BookResponse)
 def get_product(book_id: int, db: Session = Depends(get_db)):
     """Lấy chi tiết sách"""
-    book = db.query(Book).filter(Book.id == book_id, Book.is_active == True).first()
+    generation = book_fragments.generation()
+    book = find_product(book_id, db)
     if not book:
         raise HTTPException(status_code=404, detail="Sách không tồn tại")
     
-    result = BookResponse.model_validate(book).model_dump()
-    if book.category:
-        result["category_name"] = book.category.name
-    return result
+    return FastJSONResponse(book_fragments.encode([book], generation=generation)[0])
+
+def list_categories(db: Session) -> List[dict]:
+    categories = db.query(Category).all()
+    return [{"id": c.id, "name": c.name, "slug": c.slug} for c in categories]
+
+def find_category(slug: str, db: Session) -> Optional[dict]:
+    category = db.query(Category).filter(Category.slug == slug).first()
+    if not category:
+        return None
+    return {"id": category.id, "name": category.name, "slug": category.slug}
 
 @router.get("/categories/all", response_model=List[dict])
 def get_categories(db: Session = Depends(get_db)):
     """Lấy tất cả danh mục"""
-    categories = db.query(Category).all()
-    return [{"id": c.id, "name": c.name, "slug": c.slug} for c in categories]
+    return list_categories(db)
 
 @router.get("/categories/by-slug/{slug}", response_model=dict)
 def get_category_by_slug(slug: str, db: Session = Depends(get_db)):
     """Lấy danh mục theo slug"""
-    category = db.query(Category).filter(Category.slug == slug).first()
+    category = find_category(slug, db)
     if not category:
         raise HTTPException(status_code=404, detail="Danh mục không tồn tại")
-    return {"id": category.id, "name": category.name, "slug": category.slug}
+    return category
 
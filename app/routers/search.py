@@ -1,12 +1,32 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
-from app.models import Book, SessionLocal
+from sqlalchemy import or_, and_, func, case, literal, select, union_all
+from app.models import Book, Category, SessionLocal
+from app import search_index
+from app.suggest_index import suggest_index
+from app.pagination import SORT_COLUMNS, apply_sort, apply_cursor, next_cursor
+from app.cache import CatalogCache, MISSING
+from app.serialization import CARD_FIELDS, FastJSONResponse, book_fragments, project_books, splice_list, resolve_fields
+from app.routers.products import BookCardResponse
 from typing import Optional, List
 from pydantic import BaseModel
 
 router = APIRouter()
 
+# Ngưỡng đếm của chế độ count=estimate ("1,000+ kết quả")
+ESTIMATE_CAP = 1000
+
+# Tổng số kết quả theo bộ lọc đã chuẩn hóa -> (total, exact)
+count_cache = CatalogCache("search_counts", maxsize=2048, ttl=600)
+
+# Facet theo bộ lọc đã chuẩn hóa
+facet_cache = CatalogCache("search_facets", maxsize=512, ttl=600)
+
+# Các mốc giá (VND) của histogram giá: [0, 50k), [50k, 100k), ..., [500k, ∞)
+PRICE_BUCKETS = [0, 50000, 100000, 200000, 500000]
+
+TOP_AUTHORS = 10
+
 def get_db():
     db = SessionLocal()
     try:
@@ -27,27 +47,60 @@ class BookResponse(BaseModel):
     publisher: Optional[str]
     publish_year: Optional[int]
     category_id: Optional[int]
+    category_name: Optional[str] = None
     
     class Config:
         from_attributes = True
 
-@router.get("/", response_model=dict)
-def search_books(
-    q: Optional[str] = Query(None, description="Từ khóa tìm kiếm"),
-    category_id: Optional[int] = Query(None, description="Danh mục"),
-    price_min: Optional[float] = Query(None, description="Giá tối thiểu"),
-    price_max: Optional[float] = Query(None, description="Giá tối đa"),
-    author: Optional[str] = Query(None, description="Tác giả"),
-    sort_by: Optional[str] = Query("newest", description="Sắp xếp: newest, price_asc, price_desc, rating"),
-    limit: int = Query(20, ge=1, le=100),
-    offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db)
-):
-    """Tìm kiếm và lọc sách"""
-    query = db.query(Book).filter(Book.is_active == True)
+class SearchResponse(BaseModel):
+    total: Optional[int]
+    total_is_estimate: bool
+    limit: int
+    offset: int
+    next_cursor: Optional[str]
+    facets: Optional[dict] = None
+    books: List[BookCardResponse]
+
+def filter_signature(q, category_id, price_min, price_max, author) -> tuple:
+    """Khóa chuẩn hóa của bộ lọc: các cách viết khác nhau của cùng một truy vấn dùng chung cache"""
+    return (
+        search_index.build_match_query(q) if search_index.fts_available else (q or None),
+        category_id or None,
+        price_min,
+        price_max,
+        author.strip() if author and author.strip() else None,
+    )
+
+def count_results(query, db: Session, signature: tuple, mode: str):
+    """Đếm kết quả theo chế độ exact/estimate, có cache; trả về (total, exact)"""
+    cached = count_cache.get(signature)
+    if cached is not MISSING and (cached[1] or mode == "estimate"):
+        return cached
+    
+    ids = query.with_entities(Book.id).order_by(None)
+    if mode == "estimate":
+        capped = ids.limit(ESTIMATE_CAP + 1).subquery()
+        total = db.query(func.count()).select_from(capped).scalar()
+        result = (min(total, ESTIMATE_CAP), total <= ESTIMATE_CAP)
+    else:
+        result = (ids.count(), True)
     
-    # Tìm kiếm theo từ khóa
-    if q:
+    count_cache.set(signature, result)
+    return result
+
+def apply_filters(query, q=None, category_id=None, price_min=None, price_max=None, author=None, exclude=()):
+    """Áp bộ lọc tìm kiếm lên query; `exclude` bỏ qua nhóm lọc ("category", "price", "author") khi tính facet.
+    Trả về (query, hits) với hits là subquery FTS (None nếu không tìm theo từ khóa)"""
+    query = query.filter(Book.is_active == True)
+    
+    # Tìm kiếm theo từ khóa (FTS5, bỏ dấu)
+    hits = None
+    if q and search_index.fts_available:
+        # q chỉ có ký tự không tạo thành từ (vd. "!!!", "C++") -> không có MATCH, dùng ILIKE bên dưới
+        hits = search_index.match_subquery(q)
+        if hits is not None:
+            query = query.join(hits, hits.c.book_id == Book.id)
+    if q and hits is None:
         search_term = f"%{q}%"
         query = query.filter(
             or_(
@@ -58,39 +111,172 @@ def search_books(
         )
     
     # Lọc theo danh mục
-    if category_id:
+    if category_id and "category" not in exclude:
         query = query.filter(Book.category_id == category_id)
     
     # Lọc theo giá
-    if price_min is not None:
-        query = query.filter(Book.price_vnd >= price_min)
-    if price_max is not None:
-        query = query.filter(Book.price_vnd <= price_max)
-    
-    # Lọc theo tác giả
-    if author:
-        query = query.filter(Book.authors.ilike(f"%{author}%"))
-    
-    # Sắp xếp
-    if sort_by == "price_asc":
-        query = query.order_by(Book.price_vnd.asc())
-    elif sort_by == "price_desc":
-        query = query.order_by(Book.price_vnd.desc())
-    elif sort_by == "rating":
-        query = query.order_by(Book.rating_avg.desc())
-    else:  # newest
-        query = query.order_by(Book.created_at.desc())
-    
-    # Đếm tổng số
-    total = query.count()
-    
-    # Lấy kết quả
-    books = query.offset(offset).limit(limit).all()
-    
-    return {
+    if "price" not in exclude:
+        if price_min is not None:
+            query = query.filter(Book.price_vnd >= price_min)
+        if price_max is not None:
+            query = query.filter(Book.price_vnd <= price_max)
+    
+    # Lọc theo tác giả: khớp đúng giá trị mà facet "authors" đếm (GROUP BY Book.authors),
+    # nên số đếm trên facet bằng số kết quả khi chọn; tìm một phần tên tác giả dùng q
+    if author and author.strip() and "author" not in exclude:
+        query = query.filter(Book.authors == author.strip())
+    
+    return query, hits
+
+def compute_facets(db: Session, filters: dict) -> dict:
+    """Đếm theo danh mục, khoảng giá và tác giả trong một câu lệnh UNION ALL.
+    Mỗi facet bỏ qua bộ lọc của chính nó để người dùng thấy các lựa chọn thay thế."""
+    bucket = case(
+        *[(Book.price_vnd < upper, i) for i, upper in enumerate(PRICE_BUCKETS[1:])],
+        else_=len(PRICE_BUCKETS) - 1
+    )
+    
+    by_category, _ = apply_filters(
+        db.query(
+            literal("category").label("facet"),
+            Book.category_id.label("key"),
+            Category.name.label("label"),
+            func.count(Book.id).label("n")
+        ).select_from(Book).outerjoin(Category, Book.category_id == Category.id),
+        exclude=("category",), **filters
+    )
+    by_price, _ = apply_filters(
+        db.query(
+            literal("price").label("facet"),
+            bucket.label("key"),
+            literal(None).label("label"),
+            func.count(Book.id).label("n")
+        ).select_from(Book),
+        exclude=("price",), **filters
+    )
+    by_author, _ = apply_filters(
+        db.query(
+            literal("author").label("facet"),
+            literal(None).label("key"),
+            Book.authors.label("label"),
+            func.count(Book.id).label("n")
+        ).select_from(Book),
+        exclude=("author",), **filters
+    )
+    parts = [
+        by_category.group_by(Book.category_id, Category.name),
+        by_price.group_by(bucket),
+        by_author.group_by(Book.authors).order_by(func.count(Book.id).desc(), Book.authors).limit(TOP_AUTHORS),
+    ]
+    # Bọc từng phần thành subquery vì SQLite không cho ORDER BY/LIMIT trong vế của UNION
+    subqueries = [part.subquery() for part in parts]
+    rows = db.execute(union_all(*[select(sq.c.facet, sq.c.key, sq.c.label, sq.c.n) for sq in subqueries])).all()
+    
+    price_counts = [0] * len(PRICE_BUCKETS)
+    facets = {"categories": [], "prices": [], "authors": []}
+    for facet, key, label, n in rows:
+        if facet == "category":
+            facets["categories"].append({"id": key, "name": label, "count": n})
+        elif facet == "price":
+            price_counts[key] = n
+        else:
+            facets["authors"].append({"name": label, "count": n})
+    
+    facets["categories"].sort(key=lambda c: -c["count"])
+    facets["authors"].sort(key=lambda a: (-a["count"], a["name"]))
+    for i, lower in enumerate(PRICE_BUCKETS):
+        upper = PRICE_BUCKETS[i + 1] if i + 1 < len(PRICE_BUCKETS) else None
+        facets["prices"].append({"min": lower, "max": upper, "count": price_counts[i]})
+    return facets
+
+@router.get("/suggest", response_model=dict)
+async def suggest_books(
+    q: Optional[str] = Query(None, description="Từ khóa đang gõ"),
+    limit: int = Query(5, ge=1, le=20),
+):
+    """Gợi ý tìm kiếm theo tiền tố tiêu đề/tác giả (không truy vấn database)"""
+    return {"query": q or "", "books": suggest_index.suggest(q, limit)}
+
+def find_books(db: Session, q=None, category_id=None, price_min=None, price_max=None, author=None,
+               sort_by=None, limit=20, offset=0, cursor=None, count="exact", facets=False,
+               fields=CARD_FIELDS) -> dict:
+    """Một trang kết quả tìm kiếm (các trường của SearchResponse); "books" là list fragment JSON
+    đã encode của từng sách. Dùng chung cho GET /api/search/ và app/ssr.py"""
+    filters = {
+        "q": q,
+        "category_id": category_id,
+        "price_min": price_min,
+        "price_max": price_max,
+        "author": author,
+    }
+    generation = book_fragments.generation()
+    query, hits = apply_filters(db.query(Book), **filters)
+    signature = filter_signature(**filters)
+    
+    # Sắp xếp (mặc định theo độ liên quan khi có từ khóa)
+    if sort_by is None:
+        sort_by = "relevance" if hits is not None else "newest"
+    
+    if sort_by == "relevance" and hits is not None:
+        query = query.order_by(hits.c.rank.asc(), Book.id.desc())
+    else:
+        if sort_by not in SORT_COLUMNS:
+            sort_by = "newest"
+        query = apply_sort(query, sort_by)
+    
+    # Đếm tổng số (cache theo bộ lọc, bỏ qua khi count=none)
+    total, total_exact = None, True
+    if count != "none":
+        total, total_exact = count_results(query, db, signature, count)
+    
+    # Lấy kết quả (chỉ các cột cần trả về): cursor (keyset) nếu có, ngược lại dùng offset
+    keyset = sort_by in SORT_COLUMNS
+    page_query = project_books(query, fields)
+    if cursor:
+        if not keyset:
+            raise HTTPException(status_code=400, detail="Cursor không hỗ trợ sắp xếp theo độ liên quan")
+        books = apply_cursor(page_query, sort_by, cursor).limit(limit).all()
+    else:
+        books = page_query.offset(offset).limit(limit).all()
+    
+    result = {
         "total": total,
+        "total_is_estimate": not total_exact,
         "limit": limit,
         "offset": offset,
-        "books": [BookResponse.model_validate(book).model_dump() for book in books]
+        "next_cursor": next_cursor(books, sort_by, limit) if keyset else None,
     }
+    
+    if facets:
+        result["facets"] = facet_cache.get(signature)
+        if result["facets"] is MISSING:
+            result["facets"] = compute_facets(db, filters)
+            facet_cache.set(signature, result["facets"])
+    
+    result["books"] = book_fragments.encode(books, fields, generation=generation)
+    return result
 
+@router.get("/", response_model=SearchResponse)
+def search_books(
+    q: Optional[str] = Query(None, description="Từ khóa tìm kiếm"),
+    category_id: Optional[int] = Query(None, description="Danh mục"),
+    price_min: Optional[float] = Query(None, description="Giá tối thiểu"),
+    price_max: Optional[float] = Query(None, description="Giá tối đa"),
+    author: Optional[str] = Query(None, description="Tác giả (đúng tên như trong facets.authors)"),
+    sort_by: Optional[str] = Query(None, description="Sắp xếp: relevance, newest, price_asc, price_desc, rating"),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="Cursor trang kế tiếp (next_cursor), thay cho offset"),
+    count: str = Query("exact", pattern="^(exact|estimate|none)$", description="Đếm tổng: exact, estimate (tối đa 1000+), none"),
+    facets: bool = Query(False, description="Trả kèm số lượng theo danh mục, khoảng giá, tác giả"),
+    fields: Optional[str] = Query(None, description="Trường trả về: card (mặc định), full hoặc danh sách id,title,..."),
+    db: Session = Depends(get_db)
+):
+    """Tìm kiếm và lọc sách"""
+    result = find_books(
+        db, q=q, category_id=category_id, price_min=price_min, price_max=price_max, author=author,
+        sort_by=sort_by, limit=limit, offset=offset, cursor=cursor, count=count, facets=facets,
+        fields=resolve_fields(fields),
+    )
+    books = result.pop("books")
+    return FastJSONResponse(splice_list(result, "books", books))
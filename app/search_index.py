@@ -0,0 +1,142 @@
+"""
+Chỉ mục tìm kiếm toàn văn (SQLite FTS5) cho bảng books.
+
+Bảng ảo `books_fts` lưu bản sao đã bỏ dấu của title/authors/description với
+rowid = books.id, nên "tieu thuyet" khớp "tiểu thuyết". Chỉ mục được đồng bộ
+qua mapper events của Book (admin, import Excel đều đi qua ORM) và được dựng
+lại lúc khởi động nếu lệch số dòng với bảng books.
+"""
+import re
+import unicodedata
+from typing import Optional
+
+from sqlalchemy import event, inspect, text, select, table, column, literal_column
+from sqlalchemy.exc import OperationalError
+
+from app.database import Book, engine
+
+FTS_TABLE = "books_fts"
+
+# Trọng số bm25 theo thứ tự cột: title, authors, description
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+INDEXED_COLUMNS = ("title", "authors", "description")
+
+# False nếu bản SQLite không có FTS5 -> search.py quay về ILIKE
+fts_available = True
+
+books_fts = table(FTS_TABLE, column("rowid"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def fold_text(value: Optional[str]) -> str:
+    """Bỏ dấu tiếng Việt và chuyển về chữ thường: 'Tiểu Thuyết' -> 'tieu thuyet'"""
+    if not value:
+        return ""
+    # 'đ' không phải ký tự tổ hợp nên NFD không tách được
+    value = value.replace("đ", "d").replace("Đ", "D")
+    value = unicodedata.normalize("NFD", value)
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return value.lower()
+
+
+def build_match_query(q: Optional[str]) -> Optional[str]:
+    """Chuyển từ khóa người dùng thành biểu thức MATCH của FTS5 (AND các tiền tố)"""
+    tokens = _TOKEN_RE.findall(fold_text(q))
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def match_subquery(q: Optional[str]):
+    """Subquery (book_id, rank) các sách khớp từ khóa; rank càng nhỏ càng liên quan"""
+    match = build_match_query(q)
+    if match is None:
+        return None
+    weights = ", ".join(str(w) for w in BM25_WEIGHTS)
+    return (
+        select(
+            books_fts.c.rowid.label("book_id"),
+            literal_column(f"bm25({FTS_TABLE}, {weights})").label("rank"),
+        )
+        .where(literal_column(FTS_TABLE).op("MATCH")(match))
+        .subquery("search_hits")
+    )
+
+
+def _row_values(book) -> dict:
+    return {
+        "rowid": book.id,
+        "title": fold_text(book.title),
+        "authors": fold_text(book.authors),
+        "description": fold_text(book.description),
+    }
+
+
+def _upsert(connection, book):
+    connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), {"rowid": book.id})
+    connection.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, authors, description) "
+            "VALUES (:rowid, :title, :authors, :description)"
+        ),
+        _row_values(book),
+    )
+
+
+def ensure_search_index(bind=engine):
+    """Tạo bảng FTS nếu chưa có và dựng lại chỉ mục khi lệch với bảng books"""
+    global fts_available
+    with bind.begin() as conn:
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(title, authors, description, tokenize='unicode61 remove_diacritics 2')"
+            ))
+        except OperationalError as e:
+            print(f"!!! FTS5 không khả dụng, tìm kiếm dùng ILIKE: {e}")
+            fts_available = False
+            return
+
+        indexed = conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+        total = conn.execute(text("SELECT count(*) FROM books")).scalar()
+        if indexed != total:
+            rebuild_search_index(conn)
+
+
+def rebuild_search_index(conn):
+    """Dựng lại toàn bộ chỉ mục từ bảng books"""
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    rows = conn.execute(select(Book.id, Book.title, Book.authors, Book.description)).all()
+    if rows:
+        conn.execute(
+            text(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, authors, description) "
+                "VALUES (:rowid, :title, :authors, :description)"
+            ),
+            [_row_values(row) for row in rows],
+        )
+    print(f"--- Search index rebuilt: {len(rows)} books")
+
+
+# Đồng bộ chỉ mục trong cùng transaction với thay đổi của Book
+@event.listens_for(Book, "after_insert")
+def _after_book_insert(mapper, connection, target):
+    if fts_available:
+        _upsert(connection, target)
+
+
+@event.listens_for(Book, "after_update")
+def _after_book_update(mapper, connection, target):
+    if not fts_available:
+        return
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in INDEXED_COLUMNS):
+        _upsert(connection, target)
+
+
+@event.listens_for(Book, "after_delete")
+def _after_book_delete(mapper, connection, target):
+    if fts_available:
+        connection.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"), {"rowid": target.id})
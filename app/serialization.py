@@ -0,0 +1,175 @@
+"""
+Serialize JSON nhanh cho các endpoint danh sách.
+
+- FastJSONResponse: dùng orjson nếu có (fallback json chuẩn), nhận sẵn bytes.
+- project_books(): chọn đúng các cột cần trả về (tuple) thay vì nạp entity ORM.
+- book_fragments: cache bytes JSON đã encode của từng sách, bị xóa theo id
+  khi sách/danh mục thay đổi, nên trang 100 sách chỉ encode những sách mới.
+
+Trả về Response trực tiếp nên FastAPI bỏ qua bước validate lại theo
+response_model (response_model vẫn giữ cho tài liệu OpenAPI).
+"""
+import json
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from app.catalog_events import subscribe, subscribe_stock
+from app.database import Book, Category
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn
+    orjson = None
+
+# Thứ tự trường của BookResponse (products.py)
+BOOK_FIELDS = (
+    "id", "title", "authors", "description", "price_vnd", "stock", "image_url",
+    "rating_avg", "pages", "publisher", "publish_year", "category_id", "category_name",
+)
+
+# Projection gọn cho lưới sản phẩm (index.html, category.html): không có description
+CARD_FIELDS = (
+    "id", "title", "authors", "price_vnd", "stock", "image_url",
+    "rating_avg", "category_id", "category_name",
+)
+
+FIELD_PRESETS = {"card": CARD_FIELDS, "full": BOOK_FIELDS}
+
+# Luôn select thêm để tạo cursor dù client không yêu cầu
+CURSOR_FIELDS = ("created_at", "price_vnd", "rating_avg")
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if isinstance(content, (bytes, bytearray)):
+            return bytes(content)
+        return dumps(content)
+
+
+def join_fragments(fragments: Iterable[bytes]) -> bytes:
+    """Ghép các fragment JSON thành một mảng"""
+    return b"[" + b",".join(fragments) + b"]"
+
+
+def splice(envelope: dict, key: str, raw: bytes) -> bytes:
+    """Encode `envelope` kèm một trường có giá trị là JSON đã encode sẵn"""
+    head = dumps(envelope)
+    tail = b'"' + key.encode() + b'":' + raw + b"}"
+    return head[:-1] + (b"," if len(head) > 2 else b"") + tail
+
+
+def splice_list(envelope: dict, key: str, fragments: Iterable[bytes]) -> bytes:
+    """Encode `envelope` kèm một trường mảng dựng sẵn từ fragment (không encode lại từng phần tử)"""
+    return splice(envelope, key, join_fragments(fragments))
+
+
+def resolve_fields(raw: Optional[str], default: Tuple[str, ...] = CARD_FIELDS) -> Tuple[str, ...]:
+    """Tham số fields= ("card", "full" hoặc danh sách "id,title,...") -> tuple trường theo thứ tự chuẩn"""
+    if not raw:
+        return default
+    if raw in FIELD_PRESETS:
+        return FIELD_PRESETS[raw]
+    requested = {f.strip() for f in raw.split(",") if f.strip()}
+    unknown = requested - set(BOOK_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Trường không hợp lệ: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(f for f in BOOK_FIELDS if f in requested)
+
+
+def book_columns(fields: Sequence[str] = BOOK_FIELDS) -> list:
+    """Cột cần select cho các trường `fields` (+ các cột khóa cursor)"""
+    columns = [Category.name.label("category_name") if f == "category_name" else getattr(Book, f) for f in fields]
+    columns += [getattr(Book, f) for f in CURSOR_FIELDS if f not in fields]
+    return columns
+
+
+def project_books(query, fields: Sequence[str] = BOOK_FIELDS):
+    """Chuyển query(Book) sang select các cột, join danh mục khi cần tên danh mục"""
+    query = query.with_entities(*book_columns(fields))
+    if "category_name" in fields:
+        query = query.outerjoin(Category, Book.category_id == Category.id)
+    return query
+
+
+class FragmentCache:
+    """Cache bytes JSON theo (book_id, tập trường)"""
+
+    def __init__(self, maxsize: int = 50000):
+        self.maxsize = maxsize
+        self._data: Dict[Tuple[int, Tuple[str, ...]], bytes] = {}
+        self._by_book: Dict[int, Set[Tuple[str, ...]]] = {}
+        self._lock = threading.Lock()
+        # Tăng mỗi lần xóa; fragment encode từ dữ liệu đọc trước đó sẽ không được lưu
+        self._generation = 0
+        subscribe(self._on_catalog_change)
+        subscribe_stock(self.invalidate)
+
+    def generation(self) -> int:
+        return self._generation
+
+    def encode(self, rows: Iterable, fields: Sequence[str] = BOOK_FIELDS, generation: int = None) -> List[bytes]:
+        """Fragment JSON cho từng dòng (Row, BookRecord...), dùng lại bản đã cache nếu có"""
+        fields = tuple(fields)
+        if generation is None:
+            generation = self._generation
+        fragments, fresh = [], []
+        data = self._data
+        for row in rows:
+            fragment = data.get((row.id, fields))
+            if fragment is None:
+                fragment = dumps({f: getattr(row, f) for f in fields})
+                fresh.append((row.id, fragment))
+            fragments.append(fragment)
+
+        if fresh:
+            with self._lock:
+                if generation == self._generation:
+                    if len(self._data) + len(fresh) > self.maxsize:
+                        self._data.clear()
+                        self._by_book.clear()
+                    for book_id, fragment in fresh:
+                        self._data[(book_id, fields)] = fragment
+                        self._by_book.setdefault(book_id, set()).add(fields)
+        return fragments
+
+    def invalidate(self, book_ids: Set[int]):
+        with self._lock:
+            self._generation += 1
+            for book_id in book_ids:
+                for fields in self._by_book.pop(book_id, ()):
+                    self._data.pop((book_id, fields), None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+            self._by_book.clear()
+
+    def _on_catalog_change(self, book_ids, category_ids):
+        # Tên danh mục nằm trong fragment -> đổi danh mục thì xóa hết
+        if category_ids:
+            self.clear()
+        else:
+            self.invalidate(book_ids)
+
+
+book_fragments = FragmentCache()
@@ -0,0 +1,85 @@
+"""
+Dữ liệu khởi tạo cho trang sản phẩm và trang danh mục (server-side).
+
+Thay vì trả về khung HTML rỗng rồi để trình duyệt gọi /api/products/{id} hoặc
+/api/search/, main.py nhúng sẵn đúng payload JSON mà các API đó trả về vào
+template, nên lần vẽ đầu tiên không cần thêm round-trip nào. Dữ liệu lấy từ
+cùng các hàm dịch vụ mà router dùng (products.find_product, search.find_books),
+fragment JSON của sách được ghép thẳng vào payload, không encode/decode lại.
+Markup của thẻ sách và trang chi tiết vẫn do JS dựng từ payload này (cùng mã
+với lúc tải bằng fetch); server chỉ render tiêu đề và breadcrumb. HTML đã
+render được cache theo sách/trang và bị xóa khi catalog thay đổi.
+
+Tắt bằng SSR_PAGES=0 (trang quay về tải dữ liệu bằng fetch như trước).
+"""
+import json
+import os
+from typing import Optional, Tuple
+
+from app.cache import CatalogCache
+from app.catalog_events import subscribe_stock
+from app.database import SessionLocal
+from app.routers import products, search
+from app.serialization import book_fragments, splice, splice_list
+
+SSR_ENABLED = os.getenv("SSR_PAGES", "1") == "1"
+
+# HTML đã render: ("product", id) / ("category", slug, q)
+page_cache = CatalogCache("ssr_pages", maxsize=2000, ttl=300)
+
+# Khớp với tham số trang đầu tiên mà category.html tự gửi lên
+CATEGORY_PAGE_LIMIT = 20
+
+
+@subscribe_stock
+def _on_stock_change(book_ids):
+    # Trang có nhúng tồn kho: chỉ bỏ trang của các sách vừa bán và trang danh mục
+    page_cache.discard_if(lambda key: key[0] == "category" or key[1] in book_ids)
+
+
+def embed_json(payload) -> str:
+    """JSON an toàn để đặt trong thẻ <script> (không thể đóng thẻ sớm bằng '</script>')"""
+    if isinstance(payload, (bytes, bytearray)):
+        text = payload.decode("utf-8")
+    else:
+        text = json.dumps(payload, ensure_ascii=False)
+    return text.replace("<", "\\u003c")
+
+
+def product_initial_data(product_id: int) -> Tuple[Optional[str], Optional[bytes]]:
+    """(tên sách, payload của GET /api/products/{id}), (None, None) nếu sách không tồn tại"""
+    db = SessionLocal()
+    try:
+        generation = book_fragments.generation()
+        book = products.find_product(product_id, db)
+    finally:
+        db.close()
+    if book is None:
+        return None, None
+    # Cùng fragment đã encode mà API trả về, nhúng thẳng không decode lại
+    return book.title, book_fragments.encode([book], generation=generation)[0]
+
+
+def category_initial_data(category_slug: str, q: Optional[str]) -> Tuple[Optional[dict], bytes]:
+    """(danh mục hiện tại, payload categories/category/results cho category.html)"""
+    db = SessionLocal()
+    try:
+        categories = products.list_categories(db)
+        category = None
+        if category_slug and category_slug != "all":
+            category = products.find_category(category_slug, db)
+
+        results = search.find_books(
+            db,
+            q=q or None,
+            category_id=category["id"] if category else None,
+            sort_by="relevance" if q else "newest",
+            limit=CATEGORY_PAGE_LIMIT,
+            count="estimate",
+            facets=True,
+        )
+    finally:
+        db.close()
+    books = results.pop("books")
+    payload = splice({"categories": categories, "category": category}, "results", splice_list(results, "books", books))
+    return category, payload
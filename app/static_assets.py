@@ -0,0 +1,168 @@
+"""
+Static asset có fingerprint và được nén sẵn.
+
+Build (chạy lại mỗi khi sửa static/):
+
+    python -m app.static_assets
+
+Mỗi file trong static/ được chép sang static/dist/ với tên chứa hash nội dung
+(css/style.css -> dist/css/style.1a2b3c4d5e.css), file văn bản có thêm bản .gz
+và .br (nếu cài brotli). Bản đồ tên gốc -> tên mới nằm ở static/dist/manifest.json.
+
+Lúc chạy:
+- static_url("css/style.css") trả về URL có fingerprint (hoặc URL gốc nếu chưa build).
+- PrecompressedStaticFiles phục vụ bản .br/.gz theo Accept-Encoding và gắn
+  Cache-Control immutable cho đường dẫn trong dist/ (tên đổi khi nội dung đổi).
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import stat
+from typing import Dict
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+
+try:
+    import brotli
+except ImportError:  # brotli là tùy chọn, khi đó chỉ có bản .gz
+    brotli = None
+
+STATIC_DIR = "static"
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Chỉ nén các định dạng văn bản (ảnh jpg/png đã nén sẵn)
+COMPRESSIBLE_EXTENSIONS = {".css", ".js", ".svg", ".json", ".html", ".txt", ".map"}
+
+# Thứ tự ưu tiên: (encoding, hậu tố file)
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest: dict = {}
+
+
+def _fingerprint(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:10]
+
+
+def build_assets(static_dir: str = STATIC_DIR) -> dict:
+    """Tạo static/dist/ (bản có hash + .gz/.br) và manifest, trả về manifest"""
+    dist_root = os.path.join(static_dir, DIST_DIR)
+    if os.path.isdir(dist_root):
+        shutil.rmtree(dist_root)
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist_root)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            rel = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            stem, ext = os.path.splitext(rel)
+            hashed = f"{DIST_DIR}/{stem}.{_fingerprint(source)}{ext}"
+
+            target = os.path.join(static_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+
+            if ext.lower() in COMPRESSIBLE_EXTENSIONS:
+                with open(source, "rb") as f:
+                    data = f.read()
+                with open(target + ".gz", "wb") as f:
+                    f.write(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + ".br", "wb") as f:
+                        f.write(brotli.compress(data, quality=11))
+            manifest[rel] = hashed
+
+    with open(os.path.join(dist_root, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir: str = STATIC_DIR) -> dict:
+    """Đọc manifest đã build (rỗng nếu chưa chạy build)"""
+    global _manifest
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME), encoding="utf-8") as f:
+            _manifest = json.load(f)
+    except (OSError, ValueError):
+        _manifest = {}
+    return _manifest
+
+
+def static_url(path: str) -> str:
+    """URL của asset trong static/, ưu tiên bản có fingerprint"""
+    path = path.lstrip("/")
+    return f"/static/{_manifest.get(path, path)}"
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {coding: q}; coding có q=0 bị từ chối, "*" áp cho coding không được liệt kê"""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def encoding_quality(accepted: Dict[str, float], coding: str) -> float:
+    return accepted.get(coding, accepted.get("*", 0.0))
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles phục vụ bản nén sẵn và cache lâu dài cho asset có fingerprint"""
+
+    async def get_response(self, path: str, scope):
+        fingerprinted = path.replace(os.sep, "/").startswith(DIST_DIR + "/")
+        response = None
+
+        if fingerprinted and scope["method"] in ("GET", "HEAD"):
+            accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+            # q cao hơn trước, cùng q thì theo thứ tự ENCODINGS (br trước gzip)
+            candidates = sorted(
+                (item for item in ENCODINGS if encoding_quality(accepted, item[0]) > 0),
+                key=lambda item: -encoding_quality(accepted, item[0]),
+            )
+            for encoding, suffix in candidates:
+                full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+                if stat_result and stat.S_ISREG(stat_result.st_mode):
+                    response = self.file_response(full_path, stat_result, scope)
+                    response.headers["content-encoding"] = encoding
+                    media_type = mimetypes.guess_type(path)[0]
+                    if media_type:
+                        response.headers["content-type"] = media_type
+                    break
+
+        if response is None:
+            response = await super().get_response(path, scope)
+
+        if fingerprinted:
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+            response.headers["vary"] = "Accept-Encoding"
+        return response
+
+
+if __name__ == "__main__":
+    built = build_assets()
+    print(f"✅ Đã build {len(built)} asset vào {STATIC_DIR}/{DIST_DIR}/ (brotli: {'có' if brotli else 'không'})")
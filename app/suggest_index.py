@@ -0,0 +1,129 @@
+"""
+Chỉ mục tiền tố trong bộ nhớ cho ô tìm kiếm (typeahead).
+
+Mỗi sách đang bán sinh ra một khóa cho mỗi vị trí bắt đầu từ trong tiêu đề và
+tên tác giả (đã bỏ dấu), ví dụ "dat rung phuong nam" -> "dat rung phuong nam",
+"rung phuong nam", "phuong nam", "nam". Các khóa nằm trong một mảng đã sắp xếp,
+tra cứu bằng bisect nên không cần chạm tới SQLite.
+"""
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.catalog_events import subscribe
+from app.database import Book, SessionLocal
+from app.search_index import fold_text
+
+# Số khóa tối đa duyệt cho một truy vấn trước khi xếp hạng
+SCAN_LIMIT = 200
+
+# Loại khóa: 0 = đầu tiêu đề, 1 = đầu tên tác giả, 2 = giữa tiêu đề/tác giả
+TITLE_START, AUTHOR_START, INNER_WORD = 0, 1, 2
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: List[Tuple[str, int, int]] = []  # (khóa, book_id, loại khóa)
+        self._entries: Dict[int, List[Tuple[str, int, int]]] = {}
+        self._books: Dict[int, dict] = {}
+
+    def __len__(self):
+        return len(self._books)
+
+    @staticmethod
+    def _make_keys(book_id: int, title: str, authors: str) -> List[Tuple[str, int, int]]:
+        keys = set()
+        for text, start_kind in ((title, TITLE_START), (authors, AUTHOR_START)):
+            words = fold_text(text).split()
+            for i in range(len(words)):
+                keys.add((" ".join(words[i:]), book_id, start_kind if i == 0 else INNER_WORD))
+        return sorted(keys)
+
+    @staticmethod
+    def _payload(book) -> dict:
+        return {
+            "id": book.id,
+            "title": book.title,
+            "authors": book.authors,
+            "price_vnd": book.price_vnd,
+            "image_url": book.image_url,
+            "rating_avg": book.rating_avg or 0.0,
+        }
+
+    def build(self):
+        """Dựng lại toàn bộ chỉ mục từ database"""
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                Book.id, Book.title, Book.authors, Book.price_vnd, Book.image_url, Book.rating_avg
+            ).filter(Book.is_active == True).all()
+        finally:
+            db.close()
+
+        keys, entries, books = [], {}, {}
+        for row in rows:
+            entries[row.id] = self._make_keys(row.id, row.title, row.authors)
+            keys.extend(entries[row.id])
+            books[row.id] = self._payload(row)
+        keys.sort()
+
+        with self._lock:
+            self._keys, self._entries, self._books = keys, entries, books
+        print(f"--- Suggest index built: {len(books)} books, {len(keys)} keys")
+
+    def _remove(self, book_id: int):
+        for entry in self._entries.pop(book_id, ()):
+            i = bisect_left(self._keys, entry)
+            if i < len(self._keys) and self._keys[i] == entry:
+                del self._keys[i]
+        self._books.pop(book_id, None)
+
+    def refresh(self, book_ids: Set[int], category_ids: Set[int] = frozenset()):
+        """Cập nhật các sách vừa thay đổi (gọi sau commit)"""
+        if not book_ids:
+            return
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                Book.id, Book.title, Book.authors, Book.price_vnd, Book.image_url, Book.rating_avg
+            ).filter(Book.id.in_(book_ids), Book.is_active == True).all()
+        finally:
+            db.close()
+
+        with self._lock:
+            for book_id in book_ids:
+                self._remove(book_id)
+            for row in rows:
+                entries = self._make_keys(row.id, row.title, row.authors)
+                for entry in entries:
+                    insort(self._keys, entry)
+                self._entries[row.id] = entries
+                self._books[row.id] = self._payload(row)
+
+    def suggest(self, q: Optional[str], limit: int = 5) -> List[dict]:
+        """Trả về tối đa `limit` sách có tiêu đề/tác giả chứa từ bắt đầu bằng `q`"""
+        prefix = " ".join(fold_text(q).split())
+        if not prefix:
+            return []
+
+        best: Dict[int, int] = {}
+        with self._lock:
+            keys = self._keys
+            i = bisect_left(keys, (prefix,))
+            scanned = 0
+            while i < len(keys) and scanned < SCAN_LIMIT:
+                key, book_id, kind = keys[i]
+                if not key.startswith(prefix):
+                    break
+                if kind < best.get(book_id, INNER_WORD + 1):
+                    best[book_id] = kind
+                i += 1
+                scanned += 1
+            books = self._books
+            ranked = sorted(best, key=lambda book_id: (best[book_id], -books[book_id]["rating_avg"], book_id))
+            return [books[book_id] for book_id in ranked[:limit]]
+
+
+suggest_index = PrefixIndex()
+subscribe(suggest_index.refresh)
@@ -0,0 +1,256 @@
+"""
+Hàng đợi công việc nền lưu trong SQLite (bảng jobs).
+
+Request chỉ ghi job vào bảng `jobs` bằng `enqueue()` trong chính transaction
+của nó (job tồn tại khi và chỉ khi dữ liệu nghiệp vụ đã commit), rồi trả về
+ngay. Một nhóm luồng worker (TASK_WORKERS) lấy job bằng một câu UPDATE ...
+RETURNING nguyên tử và chạy handler đã đăng ký bằng `@task("kind")`.
+
+Job lỗi được thử lại với backoff lũy thừa (TASK_RETRY_BASE * 2^(lần-1), tối
+đa TASK_RETRY_MAX giây, có jitter) cho tới `max_attempts` lần rồi chuyển sang
+'failed'. Job 'running' quá TASK_LEASE giây (worker chết giữa chừng) được trả
+về 'pending'; job còn trong thời hạn thuê không bị đụng tới, kể cả khi có
+process khác (vd. reloader, worker thứ hai) đang chạy nó.
+
+Chạy hết job đã tới hạn bằng tay (vd. khi TASK_WORKERS=0):
+
+    python -m app.task_queue
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.database import Job, SessionLocal
+
+# Số luồng worker, 0 = không chạy job trong process web
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "2"))
+# Worker rảnh kiểm tra lại bảng jobs sau mỗi khoảng này (giây), wake() đánh thức sớm hơn
+TASK_POLL_INTERVAL = float(os.getenv("TASK_POLL_INTERVAL", "5"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "5"))
+TASK_RETRY_BASE = float(os.getenv("TASK_RETRY_BASE", "10"))
+TASK_RETRY_MAX = float(os.getenv("TASK_RETRY_MAX", "3600"))
+# Job 'done' được giữ lại bao nhiêu ngày trước khi xóa
+TASK_KEEP_DONE_DAYS = float(os.getenv("TASK_KEEP_DONE_DAYS", "7"))
+# Thời hạn thuê của một job 'running' (giây), phải lớn hơn thời gian chạy lâu nhất của handler
+TASK_LEASE = float(os.getenv("TASK_LEASE", "600"))
+TASK_CLEANUP_INTERVAL = 3600
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_handlers: Dict[str, Callable] = {}
+
+
+def task(kind: str):
+    """Đăng ký handler cho một loại job: handler(payload: dict), sync hoặc async"""
+    def register(func: Callable) -> Callable:
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(db: Session, kind: str, payload: dict, delay: float = 0,
+            max_attempts: int = TASK_MAX_ATTEMPTS, dedupe: bool = False) -> Job:
+    """
+    Thêm job vào transaction hiện tại của `db` (chưa commit).
+
+    `dedupe=True`: nếu đã có job cùng loại, cùng payload đang chờ thì dùng lại
+    job đó (gộp nhiều lần gọi thành một lần chạy).
+    """
+    data = json.dumps(payload, sort_keys=True)
+    if dedupe:
+        existing = db.query(Job).filter(
+            Job.status == PENDING, Job.kind == kind, Job.payload == data
+        ).first()
+        if existing is not None:
+            return existing
+    job = Job(
+        kind=kind,
+        payload=data,
+        status=PENDING,
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.add(job)
+    return job
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff lũy thừa có jitter cho lần thử thứ `attempts` vừa thất bại"""
+    delay = min(TASK_RETRY_MAX, TASK_RETRY_BASE * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_next_job(db: Session) -> Optional[Row]:
+    """Lấy nguyên tử job tới hạn sớm nhất và đánh dấu 'running'"""
+    now = datetime.utcnow()
+    next_id = select(Job.id).where(
+        Job.status == PENDING, Job.run_at <= now
+    ).order_by(Job.run_at, Job.id).limit(1).scalar_subquery()
+    # Câu ghi -> SQLite tuần tự hóa các worker, hai worker không bao giờ lấy cùng một job
+    statement = update(Job).where(
+        Job.id == next_id, Job.status == PENDING
+    ).values(
+        status=RUNNING, attempts=Job.attempts + 1, updated_at=now
+    ).returning(
+        Job.id, Job.kind, Job.payload, Job.attempts, Job.max_attempts
+    ).execution_options(synchronize_session=False)
+    row = db.execute(statement).first()
+    db.commit()
+    return row
+
+
+def run_handler(kind: str, payload: dict):
+    handler = _handlers.get(kind)
+    if handler is None:
+        raise LookupError(f"Không có handler cho job '{kind}'")
+    if asyncio.iscoroutinefunction(handler):
+        asyncio.run(handler(payload))
+    else:
+        handler(payload)
+
+
+def run_next_job() -> bool:
+    """Chạy một job tới hạn, trả về False nếu không còn job nào"""
+    db = SessionLocal()
+    try:
+        job = claim_next_job(db)
+        if job is None:
+            return False
+
+        try:
+            run_handler(job.kind, json.loads(job.payload))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            values = {"last_error": error[:2000], "updated_at": datetime.utcnow()}
+            if job.kind not in _handlers or job.attempts >= job.max_attempts:
+                values["status"] = FAILED
+                print(f"!!! Job #{job.id} ({job.kind}) thất bại sau {job.attempts} lần: {error}")
+            else:
+                values["status"] = PENDING
+                values["run_at"] = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+                print(f"!!! Job #{job.id} ({job.kind}) lỗi lần {job.attempts}, sẽ thử lại: {error}")
+            db.execute(update(Job).where(Job.id == job.id).values(**values))
+        else:
+            db.execute(update(Job).where(Job.id == job.id).values(
+                status=DONE, last_error=None, updated_at=datetime.utcnow()
+            ))
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+
+def recover_interrupted_jobs(lease: float = TASK_LEASE) -> int:
+    """Trả các job 'running' đã hết hạn thuê (worker bị dừng giữa chừng) về 'pending'"""
+    expired = datetime.utcnow() - timedelta(seconds=lease)
+    db = SessionLocal()
+    try:
+        count = db.query(Job).filter(Job.status == RUNNING, Job.updated_at < expired).update(
+            {"status": PENDING, "run_at": datetime.utcnow()}, synchronize_session=False
+        )
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+def purge_finished_jobs(keep_days: float = TASK_KEEP_DONE_DAYS) -> int:
+    """Xóa job đã xong quá `keep_days` ngày (job 'failed' được giữ lại để xem lỗi)"""
+    cutoff = datetime.utcnow() - timedelta(days=keep_days)
+    db = SessionLocal()
+    try:
+        count = db.query(Job).filter(
+            Job.status == DONE, Job.updated_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+class TaskQueue:
+    """Nhóm luồng worker chạy job từ bảng jobs"""
+
+    def __init__(self, workers: int = TASK_WORKERS, poll_interval: float = TASK_POLL_INTERVAL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._cleanup_lock = threading.Lock()
+        self._next_cleanup = 0.0
+
+    def wake(self):
+        """Báo cho worker có job mới (gọi sau khi commit transaction đã enqueue)"""
+        self._wake.set()
+
+    def _maybe_cleanup(self):
+        now = time.monotonic()
+        if now < self._next_cleanup or not self._cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_cleanup = now + TASK_CLEANUP_INTERVAL
+            recovered = recover_interrupted_jobs()
+            if recovered:
+                print(f"--- Chạy lại {recovered} job bị gián đoạn")
+            purge_finished_jobs()
+        finally:
+            self._cleanup_lock.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # clear() trước khi tìm job: wake() gọi sau đó sẽ không bị mất
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                if run_next_job():
+                    continue
+                self._maybe_cleanup()
+            except Exception as e:
+                print(f"!!! Task queue error: {e}")
+            self._wake.wait(self.poll_interval)
+
+    def start(self):
+        if self.workers <= 0 or self._threads:
+            return
+        # Job hết hạn thuê được trả lại ở lần dọn dẹp đầu tiên của worker (_maybe_cleanup)
+        self._stop.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"task-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Dừng worker, job đang chạy được chạy nốt"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+task_queue = TaskQueue()
+
+
+if __name__ == "__main__":
+    import app.tasks  # noqa: F401 - đăng ký handler
+
+    recover_interrupted_jobs()
+    processed = 0
+    while run_next_job():
+        processed += 1
+    print(f"✅ Đã chạy {processed} job")
@@ -0,0 +1,98 @@
+"""
+Các job chạy sau khi đặt hàng (xem app/task_queue.py).
+
+Checkout chỉ gọi `enqueue_order_followups()` trước khi commit; webhook tồn kho
+cho chatbot, thông báo xác nhận đơn và tổng hợp doanh số chạy ở worker nền.
+"""
+import os
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import distinct, func, literal, select
+from sqlalchemy.orm import Session
+
+from app.admin.config import deliver_webhook, webhook_product
+from app.database import Book, DailySales, Order, OrderItem, SessionLocal
+from app.task_queue import enqueue, task
+
+# URL nhận thông báo đơn hàng mới (email/SMS gateway...), trống = chỉ ghi log
+ORDER_NOTIFY_URL = os.getenv("ORDER_NOTIFY_URL", "")
+# Gộp các lần tổng hợp doanh số trong khoảng này (giây) thành một lần chạy
+ANALYTICS_ROLLUP_DELAY = float(os.getenv("ANALYTICS_ROLLUP_DELAY", "60"))
+
+
+def enqueue_order_followups(db: Session, order: Order, book_ids):
+    """Thêm các job sau đặt hàng vào transaction checkout (chưa commit)"""
+    enqueue(db, "stock_webhook", {"book_ids": sorted(book_ids)})
+    enqueue(db, "order_confirmation", {"order_id": order.id})
+    day = (order.created_at or datetime.utcnow()).strftime("%Y-%m-%d")
+    enqueue(db, "analytics_rollup", {"day": day}, delay=ANALYTICS_ROLLUP_DELAY, dedupe=True)
+
+
+@task("stock_webhook")
+async def stock_webhook(payload: dict):
+    """Báo tồn kho mới của các sách vừa bán cho chatbot, một webhook cho cả đơn"""
+    db = SessionLocal()
+    try:
+        books = db.query(Book).filter(Book.id.in_(payload["book_ids"])).all()
+        products = [webhook_product(book) for book in books]
+    finally:
+        db.close()
+    if products:
+        await deliver_webhook("update", products)
+
+
+@task("order_confirmation")
+def order_confirmation(payload: dict):
+    """Gửi thông báo xác nhận đơn hàng"""
+    db = SessionLocal()
+    try:
+        order = db.query(Order).filter(Order.id == payload["order_id"]).first()
+        if order is None:
+            return
+        message = {
+            "order_number": order.order_number,
+            "customer_name": order.customer_name,
+            "customer_phone": order.customer_phone,
+            "total": order.total,
+            "created_at": order.created_at.isoformat() if order.created_at else None,
+        }
+    finally:
+        db.close()
+
+    if not ORDER_NOTIFY_URL:
+        print(f"--- Đơn hàng mới {message['order_number']} ({message['customer_name']}, {message['total']:,.0f}đ)")
+        return
+    response = httpx.post(ORDER_NOTIFY_URL, json=message, timeout=10.0)
+    response.raise_for_status()
+
+
+@task("analytics_rollup")
+def analytics_rollup(payload: dict):
+    """Tính lại daily_sales của một ngày (UTC) từ orders/order_items, chạy lại bao nhiêu lần cũng được"""
+    start = datetime.strptime(payload["day"], "%Y-%m-%d")
+    end = start + timedelta(days=1)
+    summary = select(
+        literal(payload["day"]),
+        OrderItem.book_id,
+        func.count(distinct(OrderItem.order_id)),
+        func.sum(OrderItem.quantity),
+        func.sum(OrderItem.quantity * OrderItem.price_vnd),
+    ).join(
+        Order, Order.id == OrderItem.order_id
+    ).where(
+        Order.created_at >= start,
+        Order.created_at < end,
+        OrderItem.book_id.isnot(None),
+    ).group_by(OrderItem.book_id)
+
+    db = SessionLocal()
+    try:
+        # Xóa rồi ghi lại trong một transaction: kết quả luôn khớp dữ liệu nguồn
+        db.query(DailySales).filter(DailySales.day == payload["day"]).delete(synchronize_session=False)
+        db.execute(DailySales.__table__.insert().from_select(
+            ["day", "book_id", "orders", "quantity", "revenue"], summary
+        ))
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,245 @@
+"""
+Thumbnail ảnh bìa sách, cache trên đĩa.
+
+/img/{book_id}/{size} trả về ảnh đã thu nhỏ (WebP nếu trình duyệt hỗ trợ, ngược
+lại JPEG) thay vì bắt trang danh sách tải ảnh gốc kích thước lớn. Ảnh nguồn là
+file trong static/ hoặc URL gốc (tải bằng httpx); việc resize chạy trong một
+pool worker và mỗi thumbnail chỉ được tạo một lần dù nhiều request cùng tới.
+
+Thư mục cache bị giới hạn theo tổng dung lượng, file dùng lâu nhất bị xóa
+trước (LRU). Tên file chứa hash của image_url nên đổi ảnh sẽ tạo thumbnail mới.
+Ảnh lỗi (URL hỏng, file không phải ảnh) được nhớ trong THUMBNAIL_FAILURE_TTL
+giây để không phải tải/đọc lại ở mọi request.
+
+Tạo sẵn thumbnail cho toàn bộ catalog:
+
+    python -m app.thumbnails
+"""
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow là tùy chọn, không có thì endpoint chuyển hướng về ảnh gốc
+    Image = None
+
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_CACHE_DIR", os.path.join(".cache", "thumbnails"))
+THUMBNAIL_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_MB", "200")) * 1024 * 1024
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(min(4, os.cpu_count() or 1))))
+THUMBNAIL_FAILURE_TTL = float(os.getenv("THUMBNAIL_FAILURE_TTL", "300"))
+
+# Chiều rộng tối đa (px) của từng cỡ
+SIZES = {"sm": 120, "md": 320, "lg": 640}
+
+# format -> (tên Pillow, media type, tham số lưu)
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+STATIC_DIR = "static"
+PLACEHOLDER_URL = "/static/images/placeholder.jpg"
+FETCH_TIMEOUT = 10.0
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    return "webp" if accept and "image/webp" in accept else "jpg"
+
+
+def load_source(image_url: str) -> bytes:
+    """Đọc ảnh gốc: file trong static/ hoặc tải qua HTTP"""
+    if image_url.startswith("/static/"):
+        local = urlsplit(image_url).path[len("/static/"):]
+        path = os.path.normpath(os.path.join(STATIC_DIR, local))
+        if not path.startswith(os.path.normpath(STATIC_DIR) + os.sep):
+            raise ValueError(f"Đường dẫn ảnh không hợp lệ: {image_url}")
+        with open(path, "rb") as f:
+            return f.read()
+    response = httpx.get(image_url, timeout=FETCH_TIMEOUT, follow_redirects=True)
+    response.raise_for_status()
+    return response.content
+
+
+def resize_image(data: bytes, width: int, fmt: str) -> bytes:
+    """Thu nhỏ ảnh về chiều rộng `width` (giữ tỉ lệ, không phóng to)"""
+    pil_format, _, save_options = FORMATS[fmt]
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, pil_format, **save_options)
+        return out.getvalue()
+
+
+class ThumbnailCache:
+    """Cache thumbnail trên đĩa, LRU theo tổng dung lượng"""
+
+    def __init__(self, directory: str = THUMBNAIL_DIR, max_bytes: int = THUMBNAIL_MAX_BYTES,
+                 workers: int = THUMBNAIL_WORKERS, failure_ttl: float = THUMBNAIL_FAILURE_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.failure_ttl = failure_ttl
+        # name -> (hết hạn lúc, lỗi): ảnh lỗi gần đây, trả lỗi ngay không chạy lại
+        self._failures: Dict[str, Tuple[float, BaseException]] = {}
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        # RLock: done-callback có thể chạy ngay trong submit() khi đang giữ lock
+        self._lock = threading.RLock()
+        self._pending: Dict[str, Future] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._loaded = False
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total
+
+    def _load(self):
+        """Nạp danh sách file sẵn có, thứ tự LRU theo thời gian truy cập"""
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                files.append((st.st_atime, entry.name, st.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total += size
+        self._loaded = True
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+
+    @staticmethod
+    def filename(book_id: int, size: str, fmt: str, image_url: Optional[str]) -> str:
+        source = hashlib.sha1((image_url or "").encode("utf-8")).hexdigest()[:10]
+        return f"{book_id}-{size}-{source}.{fmt}"
+
+    def lookup(self, name: str) -> Optional[str]:
+        """Đường dẫn file nếu đã có trong cache (đánh dấu vừa dùng)"""
+        self._ensure_loaded()
+        with self._lock:
+            if name not in self._entries:
+                return None
+            self._entries.move_to_end(name)
+        return os.path.join(self.directory, name)
+
+    def store(self, name: str, data: bytes) -> str:
+        """Ghi thumbnail (atomic) và xóa file cũ nhất khi vượt dung lượng"""
+        self._ensure_loaded()
+        path = os.path.join(self.directory, name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        evicted = []
+        with self._lock:
+            self._total -= self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            self._total += len(data)
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                old_name, old_size = self._entries.popitem(last=False)
+                self._total -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(os.path.join(self.directory, old_name))
+            except OSError:
+                pass
+        return path
+
+    def _generate(self, name: str, image_url: Optional[str], size: str, fmt: str) -> str:
+        path = self.lookup(name)
+        if path is None:
+            path = self.store(name, resize_image(load_source(image_url), SIZES[size], fmt))
+        return path
+
+    def submit(self, book_id: int, size: str, fmt: str, image_url: str) -> Future:
+        """Future trả về đường dẫn thumbnail; request trùng dùng chung một job"""
+        name = self.filename(book_id, size, fmt, image_url)
+        path = self.lookup(name)
+        if path is not None:
+            future = Future()
+            future.set_result(path)
+            return future
+
+        with self._lock:
+            failure = self._failures.get(name)
+            if failure is not None:
+                if failure[0] > time.monotonic():
+                    future = Future()
+                    future.set_exception(failure[1])
+                    return future
+                del self._failures[name]
+
+            future = self._pending.get(name)
+            if future is None:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="thumbnail")
+                future = self._pool.submit(self._generate, name, image_url, size, fmt)
+                self._pending[name] = future
+                future.add_done_callback(lambda done: self._forget(name, done))
+        return future
+
+    def _forget(self, name: str, future: Future):
+        error = future.exception()
+        with self._lock:
+            self._pending.pop(name, None)
+            if error is not None:
+                self._failures[name] = (time.monotonic() + self.failure_ttl, error)
+                # Ảnh hỏng không được tính vào dung lượng cache, chỉ giữ số lượng có hạn
+                if len(self._failures) > 10000:
+                    self._failures.pop(next(iter(self._failures)))
+        if error is not None:
+            print(f"!!! Thumbnail error ({name}): {error}")
+
+
+thumbnail_cache = ThumbnailCache()
+
+
+def prewarm(formats=tuple(FORMATS), sizes=tuple(SIZES)) -> Tuple[int, int]:
+    """Tạo thumbnail cho mọi sách đang bán, trả về (số đã tạo/có sẵn, số lỗi)"""
+    from app.database import Book, SessionLocal
+
+    db = SessionLocal()
+    try:
+        books = db.query(Book.id, Book.image_url).filter(
+            Book.is_active == True, Book.image_url.isnot(None), Book.image_url != ""
+        ).all()
+    finally:
+        db.close()
+
+    futures = [
+        thumbnail_cache.submit(book.id, size, fmt, book.image_url)
+        for book in books for size in sizes for fmt in formats
+    ]
+    done, failed = 0, 0
+    for future in futures:
+        try:
+            future.result()
+            done += 1
+        except Exception:
+            failed += 1  # đã ghi log trong _forget
+    return done, failed
+
+
+if __name__ == "__main__":
+    if Image is None:
+        raise SystemExit("Cần cài Pillow để tạo thumbnail (pip install Pillow)")
+    done, failed = prewarm()
+    print(f"✅ Đã tạo {done} thumbnail ({failed} lỗi), cache {thumbnail_cache.total_bytes / 1024 / 1024:.1f} MB")
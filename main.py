@@ -1,10 +1,15 @@
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
 from jinja2 import Environment, FileSystemLoader
 from sqladmin import Admin
-from app.database import engine, Base
+from app.database import engine, Base, ensure_indexes
 from app.admin.config import setup_admin
+from app.search_index import ensure_search_index
+from app.suggest_index import suggest_index
+from app.catalog_snapshot import catalog_snapshot
+from app.static_assets import PrecompressedStaticFiles, load_manifest, static_url
+from app.catalog_events import catalog_version, stock_version
+from app.cache import MISSING
 import uvicorn
 import os
 from dotenv import load_dotenv
@@ -14,24 +19,46 @@ load_dotenv()
 
 # Tạo database tables
 Base.metadata.create_all(bind=engine)
+ensure_indexes()
+
+# Tạo / đồng bộ chỉ mục tìm kiếm toàn văn
+ensure_search_index()
+
+# Dựng chỉ mục gợi ý tìm kiếm trong bộ nhớ
+suggest_index.build()
+
+# Nạp read model catalog nếu bật CATALOG_SNAPSHOT=1
+if catalog_snapshot.enabled:
+    catalog_snapshot.load()
 
 app = FastAPI(title="Trạm Sách", description="Cửa hàng sách trực tuyến - Apple style")
 
 # Mount static files và templates
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
 jinja_env = Environment(loader=FileSystemLoader("templates"))
+load_manifest()
+jinja_env.globals["static_url"] = static_url
 
 # Setup admin panel với authentication
 from starlette.middleware.sessions import SessionMiddleware
 app.add_middleware(SessionMiddleware, secret_key=os.getenv("SECRET_KEY", "your-secret-key-change-in-production"))
 
+from app.query_counter import QueryCountMiddleware
+from app.http_cache import CatalogETagMiddleware
+app.add_middleware(CatalogETagMiddleware)
+app.add_middleware(QueryCountMiddleware)
+
 from app.admin.auth import authentication_backend
 print("--- Admin Template Dir:", os.path.join(os.path.dirname(__file__), "templates"))
 admin = Admin(app, engine, authentication_backend=authentication_backend, templates_dir=os.path.join(os.path.dirname(__file__), "templates"))
 setup_admin(admin)
 
 # Import routers
-from app.routers import products, cart, checkout, search, auth, orders, import_products
+from app.routers import products, cart, checkout, search, auth, orders, import_products, home, images
+from app import ssr
+from app.cart_store import cart_backend
+from app.cart_cleanup import cart_purger
+from app.task_queue import task_queue
 
 app.include_router(products.router, prefix="/api/products", tags=["products"])
 app.include_router(cart.router, prefix="/api/cart", tags=["cart"])
@@ -40,6 +67,25 @@ app.include_router(search.router, prefix="/api/search", tags=["search"])
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(orders.router, prefix="/api/orders", tags=["orders"])
 app.include_router(import_products.router, prefix="/api/admin", tags=["admin"])
+app.include_router(home.router, prefix="/api/home", tags=["home"])
+app.include_router(images.router, prefix="/img", tags=["images"])
+
+# Luồng nền chỉ chạy trong process phục vụ request (không chạy khi chỉ import main,
+# vd. process cha của reloader)
+@app.on_event("startup")
+def start_workers():
+    # Backend giỏ hàng (CART_BACKEND=memory: luồng nền ghi giỏ hàng xuống DB theo lô)
+    cart_backend.start()
+    # Dọn giỏ hàng bỏ quên định kỳ (CART_TTL_DAYS, CART_PURGE_INTERVAL)
+    cart_purger.start()
+    # Worker chạy job sau đặt hàng (webhook tồn kho, thông báo, thống kê)
+    task_queue.start()
+
+@app.on_event("shutdown")
+def flush_carts():
+    task_queue.stop()
+    cart_purger.stop()
+    cart_backend.stop()
 
 def render_template(template_name: str, **kwargs):
     """Helper function to render Jinja2 templates"""
@@ -51,15 +97,50 @@ async def home(request: Request):
     """Trang chủ"""
     return render_template("index.html", request=request)
 
+def render_cached_page(key, template_name: str, build_context):
+    """Render template kèm dữ liệu khởi tạo, cache HTML đến khi catalog thay đổi"""
+    html = ssr.page_cache.get(key)
+    if html is MISSING:
+        version = (catalog_version(), stock_version())
+        html = jinja_env.get_template(template_name).render(**build_context())
+        # Catalog/tồn kho đổi trong lúc render -> không lưu bản có thể đã cũ
+        if version == (catalog_version(), stock_version()):
+            ssr.page_cache.set(key, html)
+    return html
+
 @app.get("/category/{category_slug}", response_class=HTMLResponse)
-async def category_page(request: Request, category_slug: str):
+def category_page(request: Request, category_slug: str):
     """Trang danh mục"""
-    return render_template("category.html", request=request, category_slug=category_slug)
+    if not ssr.SSR_ENABLED:
+        return render_template("category.html", request=request, category_slug=category_slug)
+
+    q = (request.query_params.get("q") or "").strip()
+
+    def build_context():
+        category, data = ssr.category_initial_data(category_slug, q)
+        return {
+            "category_slug": category_slug,
+            "category_name": category["name"] if category else None,
+            "initial_data": ssr.embed_json(data),
+        }
+
+    return HTMLResponse(content=render_cached_page(("category", category_slug, q), "category.html", build_context))
 
 @app.get("/product/{product_id}", response_class=HTMLResponse)
-async def product_detail(request: Request, product_id: int):
+def product_detail(request: Request, product_id: int):
     """Trang chi tiết sản phẩm"""
-    return render_template("product.html", request=request, product_id=product_id)
+    if not ssr.SSR_ENABLED:
+        return render_template("product.html", request=request, product_id=product_id)
+
+    def build_context():
+        title, book = ssr.product_initial_data(product_id)
+        return {
+            "product_id": product_id,
+            "book_title": title,
+            "initial_book": ssr.embed_json(book),
+        }
+
+    return HTMLResponse(content=render_cached_page(("product", product_id), "product.html", build_context))
 
 @app.get("/cart", response_class=HTMLResponse)
 async def cart_page(request: Request):
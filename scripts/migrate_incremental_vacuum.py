@@ -0,0 +1,43 @@
+"""
+Migration: chuyển bookstore.db sang PRAGMA auto_vacuum = INCREMENTAL.
+
+Sau đó luồng dọn giỏ hàng (app/cart_cleanup.py) có thể trả dung lượng trống
+về hệ điều hành bằng `PRAGMA incremental_vacuum` mà không cần VACUUM toàn bộ.
+Việc chuyển chế độ phải VACUUM cả database một lần (ghi lại toàn bộ file, giữ
+khóa ghi suốt thời gian đó) nên hãy chạy khi đã dừng server.
+
+    python scripts/migrate_incremental_vacuum.py
+"""
+import sqlite3
+import os
+
+DB_FILE = "bookstore.db"
+AUTO_VACUUM_INCREMENTAL = 2
+
+def migrate():
+    if not os.path.exists(DB_FILE):
+        print(f"Database {DB_FILE} not found. Skipping migration.")
+        return
+
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+
+    try:
+        mode = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if mode == AUTO_VACUUM_INCREMENTAL:
+            print("auto_vacuum is already INCREMENTAL.")
+            return
+
+        free_pages = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        print(f"Switching auto_vacuum to INCREMENTAL (full VACUUM, {free_pages} free pages)...")
+        cursor.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        cursor.execute("VACUUM")
+        print("Migration successful.")
+
+    except Exception as e:
+        print(f"Migration error: {e}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,92 @@
+"""
+Migration: thêm cột ảnh chụp thông tin sách (book_title, book_authors,
+book_image_url) vào order_items và điền dữ liệu cho các dòng cũ từ bảng books.
+
+Backfill chạy theo từng lô id tăng dần, mỗi lô một transaction ngắn, nên có
+thể chạy khi server đang hoạt động và chạy lại an toàn (chỉ điền dòng còn NULL).
+Dòng có sách đã bị xóa (book_id NULL) không còn nguồn để điền và được giữ NULL.
+
+    python scripts/migrate_order_item_snapshot.py [batch_size]
+"""
+import sqlite3
+import os
+import sys
+
+DB_FILE = "bookstore.db"
+BATCH_SIZE = 1000
+
+SNAPSHOT_COLUMNS = [
+    ("book_title", "VARCHAR(200)"),
+    ("book_authors", "VARCHAR(200)"),
+    ("book_image_url", "VARCHAR(500)"),
+]
+
+def add_columns(cursor):
+    cursor.execute("PRAGMA table_info(order_items)")
+    columns = [info[1] for info in cursor.fetchall()]
+    for name, column_type in SNAPSHOT_COLUMNS:
+        if name not in columns:
+            print(f"Adding {name} column to order_items table...")
+            cursor.execute(f"ALTER TABLE order_items ADD COLUMN {name} {column_type} DEFAULT NULL")
+        else:
+            print(f"Column {name} already exists.")
+
+def backfill(conn, batch_size=BATCH_SIZE):
+    """Điền snapshot cho các dòng cũ, trả về số dòng đã cập nhật"""
+    cursor = conn.cursor()
+    last_id = 0
+    updated = 0
+    while True:
+        ids = [row[0] for row in cursor.execute(
+            "SELECT id FROM order_items WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size)
+        ).fetchall()]
+        if not ids:
+            break
+        last_id = ids[-1]
+
+        # UPDATE ... FROM (SQLite >= 3.33): một lần JOIN books cho cả lô
+        cursor.execute("""
+            UPDATE order_items
+            SET book_title = books.title,
+                book_authors = books.authors,
+                book_image_url = books.image_url
+            FROM books
+            WHERE books.id = order_items.book_id
+              AND order_items.id BETWEEN ? AND ?
+              AND order_items.book_title IS NULL
+        """, (ids[0], last_id))
+        updated += cursor.rowcount
+        conn.commit()
+        print(f"  ... order_items #{ids[0]}-#{last_id}: {updated} rows updated")
+
+        if len(ids) < batch_size:
+            break
+    return updated
+
+def migrate(batch_size=BATCH_SIZE):
+    if not os.path.exists(DB_FILE):
+        print(f"Database {DB_FILE} not found. Skipping migration.")
+        return
+
+    conn = sqlite3.connect(DB_FILE)
+    cursor = conn.cursor()
+
+    try:
+        add_columns(cursor)
+        conn.commit()
+
+        updated = backfill(conn, batch_size)
+        missing = cursor.execute(
+            "SELECT COUNT(*) FROM order_items WHERE book_title IS NULL"
+        ).fetchone()[0]
+        print(f"Migration successful: {updated} rows backfilled, {missing} rows without a book left empty.")
+
+    except Exception as e:
+        print(f"Migration error: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    migrate(int(sys.argv[1]) if len(sys.argv) > 1 else BATCH_SIZE)
@@ -23,9 +23,9 @@ let cartCount = 0;
 async function updateCartCount() {
     const sessionId = getSessionId();
     try {
-        const response = await fetch(`${API_BASE}/cart/?session_id=${sessionId}`);
+        const response = await fetch(`${API_BASE}/cart/summary?session_id=${sessionId}`);
         const data = await response.json();
-        cartCount = data.items ? data.items.reduce((sum, item) => sum + item.quantity, 0) : 0;
+        cartCount = data.count || 0;
 
         const badge = document.querySelector('.cart-badge');
         if (badge) {
@@ -139,7 +139,7 @@ function setupSearch() {
 
         searchTimeout = setTimeout(async () => {
             try {
-                const response = await fetch(`/api/search/?q=${encodeURIComponent(query)}&limit=5`);
+                const response = await fetch(`/api/search/suggest?q=${encodeURIComponent(query)}&limit=5`);
                 const data = await response.json();
 
                 if (data.books && data.books.length > 0) {
@@ -178,7 +178,7 @@ function renderSuggestions(books) {
         };
 
         item.innerHTML = `
-            <img src="${book.image_url || '/static/images/placeholder.jpg'}" alt="${book.title}" class="suggestion-item-image" onerror="this.src='/static/images/placeholder.jpg'">
+            <img src="/img/${book.id}/sm" loading="lazy" alt="${book.title}" class="suggestion-item-image" onerror="this.src='/static/images/placeholder.jpg'">
             <div class="suggestion-item-info">
                 <div class="suggestion-item-title">${book.title}</div>
                 <div class="suggestion-item-author">${book.authors}</div>